@@ -0,0 +1,86 @@
+"""
+Health and readiness probes
+
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import DatabaseError
+from django.http import JsonResponse
+
+from core.metrics import metrics_view
+
+_lock = threading.Lock()
+_ready = {'checked_at': None, 'checks': None}
+
+
+def check_database():
+    """Return True if the default database answers a trivial query"""
+    try:
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except DatabaseError:
+        return False
+
+
+def check_media():
+    """Return True if uploads can be written to MEDIA_ROOT"""
+    return os.access(settings.MEDIA_ROOT, os.W_OK)
+
+
+def readiness_checks():
+    """Run the readiness checks at most once per READINESS_CACHE_SECONDS"""
+    with _lock:
+        now = time.monotonic()
+        checked_at = _ready['checked_at']
+        if (checked_at is None
+                or now - checked_at >= settings.READINESS_CACHE_SECONDS):
+            _ready['checks'] = {
+                'database': check_database(),
+                'media': check_media(),
+            }
+            _ready['checked_at'] = now
+        return _ready['checks']
+
+
+def healthz(request):
+    """Liveness: the process is up and serving requests"""
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    """Readiness: the database and media volume are usable"""
+    checks = readiness_checks()
+    ready = all(checks.values())
+    return JsonResponse(
+        {'status': 'ok' if ready else 'unavailable', **checks},
+        status=200 if ready else 503,
+    )
+
+
+PROBES = {
+    '/healthz': healthz,
+    '/readyz': readyz,
+    '/metrics': metrics_view,
+}
+
+
+class HealthCheckMiddleware:
+    """Answer probes and scrapes before the rest of the middleware runs
+
+    Keep this first in MIDDLEWARE so probes skip sessions, auth and the
+    ALLOWED_HOSTS check (load balancers and Prometheus connect by IP).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        probe = PROBES.get(request.path_info.rstrip('/'))
+        if probe is not None:
+            return probe(request)
+        return self.get_response(request)
@@ -0,0 +1,83 @@
+"""
+Precomputed OpenAPI schema
+
+The schema is rendered once by `manage.py build_schema` (run at image build
+time) and served from disk. If no artifact exists it is generated on first
+request and kept in memory for the life of the worker.
+"""
+import functools
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+
+def generate_schema(fmt):
+    """Introspect the API and render the schema in fmt"""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return RENDERERS[fmt]().render(schema, renderer_context={})
+
+
+def schema_path(fmt, root=None):
+    """Return the artifact path of the schema in fmt"""
+    return (root or settings.SCHEMA_ROOT) / f'openapi.{fmt}'
+
+
+def write_schema(fmt, body, root=None):
+    """Write the schema and a gzipped copy of it"""
+    path = schema_path(fmt, root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(body)
+    path.with_name(path.name + '.gz').write_bytes(
+        gzip.compress(body, mtime=0)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema(fmt):
+    """Return (body, gzipped body, etag), from the artifact when present"""
+    path = schema_path(fmt)
+    gz_path = path.with_name(path.name + '.gz')
+    if path.exists():
+        body = path.read_bytes()
+        compressed = (
+            gz_path.read_bytes() if gz_path.exists()
+            else gzip.compress(body, mtime=0)
+        )
+    else:
+        body = generate_schema(fmt)
+        compressed = gzip.compress(body, mtime=0)
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return body, compressed, etag
+
+
+def schema_view(request):
+    """Serve the schema with ETag and gzip, json via ?format=json or Accept"""
+    fmt = request.GET.get('format')
+    if fmt not in RENDERERS:
+        accept = request.META.get('HTTP_ACCEPT', '')
+        fmt = 'json' if 'json' in accept else 'yaml'
+    body, compressed, etag = load_schema(fmt)
+
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(compressed)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body)
+    response['Content-Type'] = RENDERERS[fmt].media_type
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=300'
+    patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+    return response
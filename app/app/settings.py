@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -52,9 +55,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.health.HealthCheckMiddleware',
+    'core.middleware.RequestTimingMiddleware',
+    'core.profiling.ProfilingMiddleware',
+    'core.memory.MemoryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -85,16 +93,93 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# DB_CONN_MAX_AGE keeps connections open across requests (seconds, 0 closes
+# after every request). DB_PGBOUNCER=1 is for running behind PgBouncer in
+# transaction pooling mode, where server-side cursors can't be used.
+DB_PGBOUNCER = bool(int(os.environ.get('DB_PGBOUNCER', 0)))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
         'HOST': os.environ.get("DB_HOST"),
+        'PORT': os.environ.get("DB_PORT", ''),
         'NAME': os.environ.get("DB_NAME"),
         'USER': os.environ.get("DB_USER"),
         'PASSWORD':os.environ.get("DB_PASS"),
-        
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(
+            int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))
+        ),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 3,
+        },
+    }
+}
+
+# Read replicas: comma separated hosts in DB_REPLICA_HOSTS become databases
+# replica1, replica2, ... Safe-method requests read from a replica unless the
+# client wrote within DB_REPLICA_PIN_SECONDS or the replica lags too far.
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+    start=1,
+):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shards: comma separated hosts in DB_SHARD_HOSTS become databases shard1,
+# shard2, ... New users are spread over DB_SHARDS; existing users stay on
+# default until moved with `manage.py move_user_shard`.
+DB_SHARDS = ['default']
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(',')),
+    start=1,
+):
+    DATABASES[f'shard{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DB_SHARDS.append(f'shard{index}')
+
+DATABASE_ROUTERS = [
+    'core.routers.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 2))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(
+    os.environ.get('DB_REPLICA_LAG_CHECK_INTERVAL', 1)
+)
+
+# The default in-process cache is per worker; point CACHE_BACKEND at a
+# shared cache (e.g. memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
+# Replica read-your-writes pins live in the cache and must be seen by the
+# worker serving the client's next request
+if (any(alias.startswith('replica') for alias in DATABASES)
+        and CACHES['default']['BACKEND'] in (
+            'django.core.cache.backends.locmem.LocMemCache',
+            'django.core.cache.backends.dummy.DummyCache',
+        )):
+    raise ImproperlyConfigured(
+        'DB_REPLICA_HOSTS needs a CACHE_BACKEND shared by all workers'
+    )
 
 
 # Password validation
@@ -139,6 +224,42 @@ MEDIA_URL = '/static/media/'
 STATIC_ROOT = '/vol/web/static'
 MEDIA_ROOT = '/vol/web/media'
 
+# Requests slower than this, or running more queries, are logged
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = int(os.environ.get('SLOW_REQUEST_QUERIES', 50))
+
+# /metrics wants "Authorization: Bearer <token>"; without a token it is only
+# served with DEBUG on. The proxy also limits it to METRICS_ALLOW.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Where on-demand request profiles are stored
+PROFILE_ROOT = Path(os.environ.get('PROFILE_ROOT', '/vol/profiles'))
+
+# Queries slower than SLOW_QUERY_MS are captured. SLOW_QUERY_EXPLAIN_RATE
+# of the slow plain SELECTs are run again under EXPLAIN (ANALYZE, BUFFERS)
+# on a background thread; off by default as that repeats their load.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_EXPLAIN_RATE = float(
+    os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0)
+)
+
+# Opt-in tracemalloc snapshots every N requests per worker (0 disables)
+MEMORY_PROFILE_EVERY = int(os.environ.get('MEMORY_PROFILE_EVERY', 0))
+MEMORY_PROFILE_FRAMES = int(os.environ.get('MEMORY_PROFILE_FRAMES', 10))
+
+# How long /readyz reuses its database and media checks
+READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', 2))
+
+# Tag/ingredient autocomplete results are cached per user and prefix for
+# this long, invalidated when the user's names change (0 disables)
+AUTOCOMPLETE_CACHE_SECONDS = int(os.environ.get('AUTOCOMPLETE_CACHE_SECONDS', 60))
+
+# Facet counts of a filtered recipe list are cached per user version
+FACET_CACHE_SECONDS = int(os.environ.get('FACET_CACHE_SECONDS', 300))
+
+# Prebuilt OpenAPI schema, written by `manage.py build_schema`
+SCHEMA_ROOT = Path(os.environ.get('SCHEMA_ROOT', BASE_DIR / 'schema'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -13,23 +13,38 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+from drf_spectacular.views import SpectacularSwaggerView
 from django.contrib import admin
 from django.urls import path ,include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from app.health import healthz, readyz
+from app.schema import schema_view
+from core.memory import MemoryReportView
+from core.metrics import metrics_view
+from core.profiling import ProfileDetailView, ProfileListView
+from core.slow_queries import SlowQueryView
+
 urlpatterns = [
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
+    path('metrics', metrics_view, name='metrics'),
     path('admin/', admin.site.urls),
-    path('api/schema/',SpectacularAPIView.as_view(), name='api-schema'),
+    path('api/schema/',schema_view, name='api-schema'),
     path(
         'api/docs/',
         SpectacularSwaggerView.as_view(url_name ='api-schema' ),
         name='api-docs',
     ),
+    path('api/profiles/', ProfileListView.as_view(), name='profile-list'),
+    path(
+        'api/profiles/<str:name>',
+        ProfileDetailView.as_view(),
+        name='profile-detail',
+    ),
+    path('api/slow-queries/', SlowQueryView.as_view(), name='slow-queries'),
+    path('api/memory/', MemoryReportView.as_view(), name='memory-report'),
     path('api/user/', include('user.urls')),
     path('api/recipe/',include('recipe.urls'))
 ]
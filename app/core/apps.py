@@ -1,6 +1,27 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core.db import check_persistent_connections
+        from core.profiling import reload_rates
+        from core.sharding import connect_signals
+        from core.slow_queries import install_wrapper
+        from core.models import Recipe
+        from core.user_cache import bump_on_m2m_change, bump_user_cache_version
+        request_started.connect(check_persistent_connections)
+        connect_signals()
+        connection_created.connect(install_wrapper)
+        post_save.connect(reload_rates, sender='core.ProfilingRule')
+        post_delete.connect(reload_rates, sender='core.ProfilingRule')
+        for model in ('core.Recipe', 'core.Tag', 'core.Ingredient'):
+            post_save.connect(bump_user_cache_version, sender=model)
+            post_delete.connect(bump_user_cache_version, sender=model)
+        for through in (Recipe.tag.through, Recipe.ingredients.through):
+            m2m_changed.connect(bump_on_m2m_change, sender=through)
@@ -0,0 +1,26 @@
+"""
+Authentication classes
+
+"""
+import time
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import metrics
+
+
+class MeteredTokenAuthentication(TokenAuthentication):
+    """Token authentication that records lookup counts and latency"""
+
+    def authenticate_credentials(self, key):
+        start = time.perf_counter()
+        try:
+            result = super().authenticate_credentials(key)
+        except AuthenticationFailed:
+            metrics.TOKEN_AUTH.labels('failed').inc()
+            raise
+        finally:
+            metrics.TOKEN_AUTH_SECONDS.observe(time.perf_counter() - start)
+        metrics.TOKEN_AUTH.labels('ok').inc()
+        return result
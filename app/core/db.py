@@ -0,0 +1,34 @@
+"""
+Database connection helpers
+
+"""
+from django.db import connections
+
+
+def _checked_ensure_connection(conn):
+    """Return ensure_connection for conn that first runs a pending check"""
+    def ensure_connection():
+        if not conn.health_check_done:
+            conn.health_check_done = True
+            if conn.connection is not None and not conn.is_usable():
+                conn.close()
+        type(conn).ensure_connection(conn)
+    return ensure_connection
+
+
+def check_persistent_connections(**kwargs):
+    """Drop persistent connections that went away while the worker idled.
+
+    Django 3.2 has no CONN_HEALTH_CHECKS, so without this the first query
+    after a Postgres/PgBouncer restart fails with the dead connection. As
+    in Django 4.1 the check runs when the request first uses a connection,
+    requests that never query (probes, cached responses) skip the ping.
+    """
+    for conn in connections.all():
+        if conn.connection is None:
+            continue
+        if not conn.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        conn.health_check_done = False
+        if 'ensure_connection' not in vars(conn):
+            conn.ensure_connection = _checked_ensure_connection(conn)
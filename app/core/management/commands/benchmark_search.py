@@ -0,0 +1,75 @@
+"""
+Django command to time recipe full text search on a seeded corpus
+
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe.views import RecipeViewSet
+
+WORDS = (
+    'curry chicken noodle soup tomato basil garlic lemon roast beef '
+    'pasta salad spicy sweet sour smoked grilled baked fresh green '
+    'mushroom rice bean lentil coconut ginger honey chili pepper'
+).split()
+
+
+class Command(BaseCommand):
+    """Seed recipes for one user and report ?search= latency"""
+    help = 'Benchmark full text search over recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument(
+            '--term',
+            action='append',
+            dest='terms',
+            help='Search term to time, can be repeated',
+        )
+        parser.add_argument('--email', default='search-bench@example.com')
+
+    def seed(self, user, count, batch_size):
+        rng = random.Random(0)
+        existing = Recipe.objects.filter(user=user).count()
+        for start in range(existing, count, batch_size):
+            Recipe.objects.bulk_create([
+                Recipe(
+                    user=user,
+                    title=' '.join(rng.sample(WORDS, 3)),
+                    description=' '.join(rng.choices(WORDS, k=40)),
+                    time_minutes=rng.randint(5, 120),
+                    price=Decimal(rng.randint(100, 5000)) / 100,
+                )
+                for _ in range(start, min(start + batch_size, count))
+            ])
+        if existing < count:
+            self.stdout.write(f'Seeded {count - existing} recipes')
+
+    def handle(self, *args, **options):
+        """Entry point of commands"""
+        user, _ = get_user_model().objects.get_or_create(
+            email=options['email'],
+        )
+        self.seed(user, options['recipes'], options['batch_size'])
+
+        view = RecipeViewSet()
+        queryset = Recipe.objects.filter(user=user).order_by('-id')
+        for term in options['terms'] or ['curry', 'spicy -chicken']:
+            timings = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                found = list(view._search(queryset, term)[:20])
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{term!r}: {len(found)} results, '
+                f'p50={timings[len(timings) // 2]:.1f}ms '
+                f'max={timings[-1]:.1f}ms'
+            )
@@ -0,0 +1,42 @@
+"""
+Django command to prebuild the OpenAPI schema artifact
+
+"""
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.schema import RENDERERS, generate_schema, schema_path, write_schema
+
+
+class Command(BaseCommand):
+    """Render the schema to SCHEMA_ROOT, or check it is up to date"""
+    help = 'Write the OpenAPI schema served at /api/schema/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Fail if the artifact does not match the code',
+        )
+        parser.add_argument('--root', type=Path, default=None)
+
+    def handle(self, *args, **options):
+        """Entry point of commands"""
+        stale = []
+        for fmt in RENDERERS:
+            body = generate_schema(fmt)
+            path = schema_path(fmt, options['root'])
+            if options['check']:
+                if not path.exists() or path.read_bytes() != body:
+                    stale.append(str(path))
+                continue
+            write_schema(fmt, body, options['root'])
+            self.stdout.write(f'Wrote {path}')
+
+        if stale:
+            raise CommandError(
+                'Schema out of date, run build_schema: ' + ', '.join(stale)
+            )
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('Schema up to date'))
@@ -0,0 +1,42 @@
+"""
+Django command to rebuild the similar-recipe index
+
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sharding import shard_for_user, use_shard
+from recipe.similarity import SIMILAR_RECIPES, rebuild_user
+
+
+class Command(BaseCommand):
+    """Recompute the top similar recipes of every recipe, user by user"""
+    help = 'Rebuild the similar-recipe index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            help='Only rebuild the recipes of this user',
+        )
+        parser.add_argument('--k', type=int, default=SIMILAR_RECIPES)
+
+    def handle(self, *args, **options):
+        """Entry point of commands"""
+        users = get_user_model().objects.using('default').order_by('id')
+        if options['email']:
+            users = users.filter(email=options['email'])
+            if not users.exists():
+                raise CommandError(f"No user {options['email']}")
+
+        total = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            alias, moving = shard_for_user(user_id)
+            if moving:
+                self.stdout.write(f'Skipping user {user_id}, shard move')
+                continue
+            use_shard(alias)
+            try:
+                total += rebuild_user(user_id, options['k'])
+            finally:
+                use_shard(None)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {total} neighbours'))
@@ -0,0 +1,187 @@
+"""
+Django command to move a user's recipe data to another shard
+
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count
+
+from core.models import (
+    Ingredient,
+    Recipe,
+    RecipeSimilarity,
+    Tag,
+    UserRecipeStats,
+    UserShard,
+)
+from core.sharding import (
+    SHARD_CACHE_TIMEOUT,
+    mirror_user,
+    set_shard,
+    shard_for_user,
+)
+
+# Longest a request may run (UWSGI_HARAKIRI), in-flight writes finish by then
+DRAIN_SECONDS = 60
+
+
+class Command(BaseCommand):
+    """Copy a user's tags, ingredients and recipes to a shard and switch.
+
+    Writes for the user are refused while the copy runs, reads keep being
+    served from the old shard until the shard map flips. Row counts are
+    compared before the switch and again before the source rows go.
+    """
+    help = "Move a user's recipe data to another shard"
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument(
+            '--to',
+            help='Target shard (defaults to the least loaded one)',
+        )
+        parser.add_argument(
+            '--drain-seconds',
+            type=float,
+            default=DRAIN_SECONDS,
+            help='Wait for in-flight writes after blocking new ones',
+        )
+        parser.add_argument(
+            '--grace-seconds',
+            type=float,
+            default=SHARD_CACHE_TIMEOUT,
+            help='Keep the source rows until cached placements expire',
+        )
+
+    def least_loaded_shard(self):
+        """Return the shard with the fewest users placed on it"""
+        counts = dict(
+            UserShard.objects.using('default').values_list('alias')
+            .annotate(users=Count('id'))
+        )
+        counts['default'] = counts.get('default', 0) + (
+            get_user_model().objects.using('default')
+            .filter(shard__isnull=True).count()
+        )
+        return min(settings.DB_SHARDS, key=lambda alias: counts.get(alias, 0))
+
+    def user_rows(self, user, alias):
+        """Return (model, queryset) of a user's sharded rows, parents first"""
+        return [
+            (Tag, Tag.objects.using(alias).filter(user=user)),
+            (Ingredient, Ingredient.objects.using(alias).filter(user=user)),
+            (Recipe, Recipe.objects.using(alias).filter(user=user)),
+            (
+                Recipe.tag.through,
+                Recipe.tag.through.objects.using(alias)
+                .filter(recipe__user=user),
+            ),
+            (
+                Recipe.ingredients.through,
+                Recipe.ingredients.through.objects.using(alias)
+                .filter(recipe__user=user),
+            ),
+            (
+                RecipeSimilarity,
+                RecipeSimilarity.objects.using(alias)
+                .filter(recipe__user=user),
+            ),
+            (
+                UserRecipeStats,
+                UserRecipeStats.objects.using(alias).filter(user=user),
+            ),
+        ]
+
+    def row_counts(self, user, alias):
+        """Return the number of the user's rows per model on alias"""
+        return {
+            model._meta.label: rows.count()
+            for model, rows in self.user_rows(user, alias)
+        }
+
+    def copy_rows(self, user, source, target):
+        """Copy the user's sharded rows keeping their primary keys"""
+        copies = [
+            (model, list(rows)) for model, rows in self.user_rows(user, source)
+        ]
+        with transaction.atomic(using=target):
+            for model, rows in copies:
+                model.objects.using(target).bulk_create(rows)
+            self.reset_sequences(target, [model for model, _ in copies])
+
+    def reset_sequences(self, alias, models):
+        """Move the id sequences of models on alias past the stored ids"""
+        connection = connections[alias]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def delete_rows(self, user, alias):
+        """Delete the user's sharded rows on alias"""
+        UserRecipeStats.objects.using(alias).filter(user=user).delete()
+        Recipe.objects.using(alias).filter(user=user).delete()
+        Tag.objects.using(alias).filter(user=user).delete()
+        Ingredient.objects.using(alias).filter(user=user).delete()
+
+    def handle(self, *args, **options):
+        """Entry point of commands"""
+        try:
+            user = get_user_model().objects.using('default').get(
+                email=options['email'],
+            )
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user {options['email']}")
+
+        target = options['to'] or self.least_loaded_shard()
+        if target not in settings.DB_SHARDS:
+            raise CommandError(f'Unknown shard {target}')
+        source, moving = shard_for_user(user.pk, fresh=True)
+        if moving:
+            raise CommandError(f'{user.email} is already being moved')
+        if source == target:
+            self.stdout.write(f'{user.email} already on {target}')
+            return
+
+        # Writes read the stored placement, so new ones are refused from
+        # here; wait for those that passed the check before copying
+        set_shard(user.pk, source, moving=True)
+        time.sleep(options['drain_seconds'])
+        try:
+            mirror_user(user, target)
+            self.copy_rows(user, source, target)
+            expected = self.row_counts(user, source)
+            if self.row_counts(user, target) != expected:
+                raise CommandError(
+                    f'Rows of {user.email} changed on {source} during '
+                    f'the copy, try again with a longer --drain-seconds'
+                )
+        except IntegrityError as exc:
+            set_shard(user.pk, source)
+            raise CommandError(
+                f'Rows of {user.email} already exist on {target}: {exc}'
+            )
+        except Exception:
+            self.delete_rows(user, target)
+            set_shard(user.pk, source)
+            raise
+
+        set_shard(user.pk, target)
+        # Reads may use a cached placement for a while longer, keep the
+        # source rows until those expire and check nothing was written
+        time.sleep(options['grace_seconds'])
+        if self.row_counts(user, source) != expected:
+            raise CommandError(
+                f'Rows of {user.email} changed on {source} after the move, '
+                f'left them in place for review'
+            )
+        self.delete_rows(user, source)
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {expected[Recipe._meta.label]} recipes of {user.email} "
+            f'from {source} to {target}'
+        ))
@@ -0,0 +1,44 @@
+"""
+Django command to rebuild the per-user recipe stats
+
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sharding import shard_for_user, use_shard
+from recipe.stats import rebuild_user
+
+
+class Command(BaseCommand):
+    """Recompute every user's dashboard stats from their recipe data"""
+    help = 'Rebuild the per-user recipe stats table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            help='Only rebuild the stats of this user',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point of commands"""
+        users = get_user_model().objects.using('default').order_by('id')
+        if options['email']:
+            users = users.filter(email=options['email'])
+            if not users.exists():
+                raise CommandError(f"No user {options['email']}")
+
+        rebuilt = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            alias, moving = shard_for_user(user_id)
+            if moving:
+                self.stdout.write(f'Skipping user {user_id}, shard move')
+                continue
+            use_shard(alias)
+            try:
+                rebuild_user(user_id)
+            finally:
+                use_shard(None)
+            rebuilt += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt stats of {rebuilt} users')
+        )
@@ -0,0 +1,109 @@
+"""
+Django command to prepare a container for serving
+
+"""
+import hashlib
+import os
+import time
+from importlib import import_module
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.recorder import MigrationRecorder
+
+STATIC_STAMP = '.static-manifest'
+
+
+def static_manifest_hash():
+    """Hash the path and contents of every file collectstatic would copy"""
+    digest = hashlib.sha256()
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list(['CVS', '.*', '*~']):
+            entries.append((path, storage.path(path)))
+    for path, full_path in sorted(entries):
+        digest.update(path.encode())
+        with open(full_path, 'rb') as static_file:
+            digest.update(static_file.read())
+    return digest.hexdigest()
+
+
+def migration_files():
+    """List (app_label, name) of migration files without loading them"""
+    found = set()
+    for app_config in apps.get_app_configs():
+        try:
+            module = import_module(f'{app_config.name}.migrations')
+        except ImportError:
+            continue
+        if not getattr(module, '__file__', None):
+            continue
+        for entry in os.listdir(os.path.dirname(module.__file__)):
+            name, ext = os.path.splitext(entry)
+            if ext == '.py' and name != '__init__' and name[0] != '_':
+                found.add((app_config.label, name))
+    return found
+
+
+def pending_migrations(database=DEFAULT_DB_ALIAS):
+    """Return migration files not recorded as applied in database"""
+    recorder = MigrationRecorder(connections[database])
+    if not recorder.has_table():
+        return migration_files()
+    applied = set(
+        recorder.migration_qs.values_list('app', 'name')
+    )
+    return migration_files() - applied
+
+
+class Command(BaseCommand):
+    """Run collectstatic and migrate only when there is work to do"""
+    help = 'Collect static files and migrate if needed, with timings'
+
+    def timed(self, label, func):
+        """Run func and record how long it took"""
+        start = time.monotonic()
+        result = func()
+        self.timings.append((label, time.monotonic() - start))
+        return result
+
+    def collect_static(self):
+        stamp = Path(settings.STATIC_ROOT) / STATIC_STAMP
+        manifest = self.timed('hash static', static_manifest_hash)
+        if stamp.exists() and stamp.read_text() == manifest:
+            self.stdout.write('Static files unchanged, skipping collectstatic')
+            return
+        self.timed(
+            'collectstatic',
+            lambda: call_command('collectstatic', interactive=False,
+                                 verbosity=0),
+        )
+        stamp.write_text(manifest)
+
+    def migrate(self, database):
+        pending = self.timed(
+            f'check {database}',
+            lambda: pending_migrations(database),
+        )
+        if not pending:
+            self.stdout.write(f'No pending migrations on {database}')
+            return
+        self.timed(
+            f'migrate {database}',
+            lambda: call_command('migrate', database=database,
+                                 interactive=False, verbosity=1),
+        )
+
+    def handle(self, *args, **options):
+        """Entry point of commands"""
+        self.timings = []
+        self.collect_static()
+        for database in settings.DB_SHARDS:
+            self.migrate(database)
+        for label, seconds in self.timings:
+            self.stdout.write(f'{label:<18}{seconds * 1000:8.1f} ms')
@@ -2,23 +2,84 @@
 Django commands to wait for database to be available
 
 """
+import random
+import socket
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 from psycopg2 import OperationalError as PsycopgOpError
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+PROBE_ERRORS = (PsycopgOpError, OperationalError, OSError)
+
 
 class Command(BaseCommand):
     """Django command to wait for DB """
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='append',
+            dest='databases',
+            help='Database alias to wait for (repeatable, default: default)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Give up after this many seconds',
+        )
+        parser.add_argument('--initial-delay', type=float, default=0.1)
+        parser.add_argument('--max-delay', type=float, default=5)
+
+    def probe(self, alias):
+        """Check alias accepts connections, TCP first then a real login"""
+        conn = connections[alias]
+        host = conn.settings_dict.get('HOST')
+        if host and not host.startswith('/'):
+            port = int(conn.settings_dict.get('PORT') or 5432)
+            socket.create_connection((host, port), timeout=2).close()
+        conn.ensure_connection()
+        conn.close()
+
+    def wait(self, alias, options):
+        """Probe alias with exponential backoff until up or timed out"""
+        start = time.monotonic()
+        deadline = start + options['timeout']
+        delay = options['initial_delay']
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                self.probe(alias)
+                return attempts, time.monotonic() - start
+            except PROBE_ERRORS as exc:
+                sleep_for = random.uniform(delay / 2, delay)
+                if time.monotonic() + sleep_for > deadline:
+                    raise CommandError(
+                        f'Database {alias} unavailable after '
+                        f'{time.monotonic() - start:.1f}s: {exc}'
+                    )
+                self.stdout.write(
+                    f'Database {alias} unavailable, '
+                    f'waiting {sleep_for:.2f} sec...'
+                )
+                time.sleep(sleep_for)
+                delay = min(delay * 2, options['max_delay'])
+
     def handle(self, *args, **options) :
         """Entry point of commands"""
+        databases = options['databases'] or ['default']
         self.stdout.write("waiting for database ...")
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases =  ['default'])
-                db_up = True
-            except (PsycopgOpError , OperationalError):
-                self.stdout.write('Database unavailable , waiting 1 sec...')
-                time.sleep(1)
-        self.stdout.write(self.style.SUCCESS('Database  available'))
+        with ThreadPoolExecutor(max_workers=len(databases)) as pool:
+            results = pool.map(
+                lambda alias: (alias, self.wait(alias, options)),
+                databases,
+            )
+            for alias, (attempts, elapsed) in results:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Database {alias} available after {elapsed:.2f}s '
+                    f'({attempts} attempts)'
+                ))
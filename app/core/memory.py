@@ -0,0 +1,153 @@
+"""
+Worker memory profiling
+
+With MEMORY_PROFILE_EVERY=N set, each worker starts tracemalloc and every N
+requests snapshots its allocations, diffs them against the first snapshot
+and the previous one and keeps the top growing allocation sites. Staff can
+read the report of the worker that serves them at /api/memory/ (the soak
+script polls it to follow every worker's RSS).
+"""
+import os
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from drf_spectacular.utils import extend_schema, inline_serializer
+from rest_framework import serializers
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.authentication import MeteredTokenAuthentication
+
+TOP_STATS = 15
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+]
+
+_lock = threading.Lock()
+_state = {
+    'requests': 0,
+    'baseline': None,
+    'previous': None,
+    'report': None,
+}
+
+
+def rss_bytes():
+    """Resident set size of this process, 0 where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:
+        return 0
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def top_growth(snapshot, previous):
+    """Return the allocation sites that grew most since previous"""
+    stats = snapshot.compare_to(previous, 'traceback')
+    return [
+        {
+            'size_diff': stat.size_diff,
+            'count_diff': stat.count_diff,
+            'size': stat.size,
+            'traceback': [
+                f'{frame.filename}:{frame.lineno}'
+                for frame in stat.traceback
+            ],
+        }
+        for stat in stats[:TOP_STATS]
+        if stat.size_diff > 0
+    ]
+
+
+def take_snapshot():
+    """Snapshot allocations and update the report"""
+    snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    with _lock:
+        baseline = _state['baseline']
+        previous = _state['previous']
+        if baseline is None:
+            _state['baseline'] = snapshot
+        traced, peak = tracemalloc.get_traced_memory()
+        _state['report'] = {
+            'pid': os.getpid(),
+            'requests': _state['requests'],
+            'rss': rss_bytes(),
+            'traced': traced,
+            'traced_peak': peak,
+            'taken_at': time.time(),
+            'since_start': top_growth(snapshot, baseline) if baseline else [],
+            'since_previous': (
+                top_growth(snapshot, previous) if previous else []
+            ),
+        }
+        _state['previous'] = snapshot
+
+
+def memory_report():
+    """Return the latest report of this worker"""
+    with _lock:
+        report = dict(_state['report'] or {'pid': os.getpid()})
+        report['rss'] = rss_bytes()
+        report['requests'] = _state['requests']
+    return report
+
+
+class MemoryProfilingMiddleware:
+    """Snapshot allocations every MEMORY_PROFILE_EVERY requests"""
+
+    def __init__(self, get_response):
+        if not settings.MEMORY_PROFILE_EVERY:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.MEMORY_PROFILE_FRAMES)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        with _lock:
+            _state['requests'] += 1
+            due = (
+                _state['baseline'] is None
+                or _state['requests'] % settings.MEMORY_PROFILE_EVERY == 0
+            )
+        if due:
+            take_snapshot()
+        return response
+
+
+class MemoryReportView(APIView):
+    """Memory report of the worker serving this request"""
+    authentication_classes = [MeteredTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        responses=inline_serializer(
+            'MemoryReport',
+            {
+                'pid': serializers.IntegerField(),
+                'requests': serializers.IntegerField(),
+                'rss': serializers.IntegerField(),
+                # the rest only once a snapshot was taken
+                'traced': serializers.IntegerField(required=False),
+                'traced_peak': serializers.IntegerField(required=False),
+                'taken_at': serializers.FloatField(required=False),
+                'since_start': serializers.ListField(
+                    child=serializers.DictField(),
+                    required=False,
+                ),
+                'since_previous': serializers.ListField(
+                    child=serializers.DictField(),
+                    required=False,
+                ),
+            },
+        ),
+    )
+    def get(self, request):
+        return Response(memory_report())
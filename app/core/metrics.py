@@ -0,0 +1,109 @@
+"""
+Prometheus metrics
+
+Each process keeps its own registry. When PROMETHEUS_MULTIPROC_DIR is set
+(run.sh does this for uWSGI/gunicorn workers) every worker writes its
+samples to that directory and /metrics aggregates them across workers.
+"""
+import hmac
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Request latency by route',
+    ['route', 'method', 'status', 'tier'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Database queries per request',
+    ['route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds',
+    'Database time per request',
+    ['route'],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'app_cache_requests_total',
+    'Cache lookups by cache and result',
+    ['cache', 'result'],
+)
+TOKEN_AUTH = Counter(
+    'app_token_auth_total',
+    'Token authentication lookups by result',
+    ['result'],
+)
+TOKEN_AUTH_SECONDS = Histogram(
+    'app_token_auth_seconds',
+    'Time spent looking up auth tokens',
+    buckets=LATENCY_BUCKETS,
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'app_image_upload_bytes',
+    'Size of uploaded recipe images',
+    buckets=(10e3, 50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6),
+)
+
+
+def user_tier(request):
+    """Coarse label for who made the request"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return 'anonymous'
+    return 'staff' if user.is_staff else 'user'
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup"""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def observe_request(request, response, timing):
+    """Record the metrics of a finished request"""
+    route = timing['view'] or 'unmatched'
+    REQUEST_LATENCY.labels(
+        route,
+        request.method,
+        str(response.status_code),
+        user_tier(request),
+    ).observe(timing['total_ms'] / 1000)
+    REQUEST_DB_QUERIES.labels(route).observe(timing['db_queries'])
+    REQUEST_DB_SECONDS.labels(route).observe(timing['db_ms'] / 1000)
+
+
+def metrics_view(request):
+    """Expose metrics in the Prometheus text format"""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        given = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(given.encode(), expected.encode()):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return HttpResponse(
+        generate_latest(registry),
+        content_type=CONTENT_TYPE_LATEST,
+    )
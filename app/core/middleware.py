@@ -0,0 +1,188 @@
+"""
+Middleware for the app
+
+"""
+import hashlib
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework import serializers
+
+from core.metrics import observe_request, record_cache
+from core.routers import choose_replica, set_read_database
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+logger = logging.getLogger('app.timing')
+
+
+def _client_key(request):
+    """Identify the client from its credentials before auth has run"""
+    credential = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credential:
+        return None
+    digest = hashlib.sha1(credential.encode()).hexdigest()
+    return f'db-pin:{digest}'
+
+
+class ReplicaRoutingMiddleware:
+    """Serve safe requests from a replica unless the client just wrote"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = _client_key(request)
+        if request.method in SAFE_METHODS:
+            pinned = key is not None and cache.get(key)
+            if key is not None:
+                record_cache('replica_pin', bool(pinned))
+            set_read_database(None if pinned else choose_replica())
+        else:
+            set_read_database(None)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            set_read_database(None)
+
+        if (request.method not in SAFE_METHODS and key is not None
+                and response.status_code < 400):
+            cache.set(key, True, settings.DB_REPLICA_PIN_SECONDS)
+        return response
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and their duration"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def _add_serialize_time(serializer, seconds):
+    """Count seconds towards the serialize time of the serializer's request"""
+    request = serializer.context.get('request')
+    # views pass the DRF request, the middleware holds the Django one
+    request = getattr(request, '_request', request)
+    if request is not None:
+        request._serialize_seconds = (
+            getattr(request, '_serialize_seconds', 0) + seconds
+        )
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """List serializer whose .data is timed like TimedSerializerMixin"""
+
+    @property
+    def data(self):
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            _add_serialize_time(self, time.perf_counter() - start)
+
+
+class TimedSerializerMixin:
+    """Time building .data, reported as serialize_ms of the request
+
+    Nested serializers are built through to_representation, so only the
+    top level serializer of a response adds time.
+    """
+
+    @property
+    def data(self):
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            _add_serialize_time(self, time.perf_counter() - start)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        if type(serializer) is serializers.ListSerializer:
+            serializer.__class__ = TimedListSerializer
+        return serializer
+
+
+class RequestTimingMiddleware:
+    """Time each request and break it down into DB, serialize and render time
+
+    Serialize time is spent building serializer.data (serializers using
+    TimedSerializerMixin), render time turning it into the response body.
+    The numbers are kept on request.timing, sent as a Server-Timing header
+    to staff users and logged when over SLOW_REQUEST_MS or
+    SLOW_REQUEST_QUERIES.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(queries))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        request.timing = timing = {
+            'view': match.view_name if match else None,
+            'total_ms': total * 1000,
+            'db_ms': queries.seconds * 1000,
+            'db_queries': queries.count,
+            'serialize_ms': getattr(request, '_serialize_seconds', 0) * 1000,
+            'render_ms': getattr(request, '_render_seconds', 0) * 1000,
+            'size': 0 if response.streaming else len(response.content),
+        }
+
+        observe_request(request, response, timing)
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = (
+                f'total;dur={timing["total_ms"]:.1f}, '
+                f'db;dur={timing["db_ms"]:.1f};'
+                f'desc="{timing["db_queries"]} queries", '
+                f'serialize;dur={timing["serialize_ms"]:.1f}, '
+                f'render;dur={timing["render_ms"]:.1f}'
+            )
+
+        if (timing['total_ms'] > settings.SLOW_REQUEST_MS
+                or timing['db_queries'] > settings.SLOW_REQUEST_QUERIES):
+            logger.warning(
+                'slow request %s %s view=%s total=%.1fms db=%.1fms '
+                'queries=%d serialize=%.1fms render=%.1fms size=%d',
+                request.method, request.path, timing['view'],
+                timing['total_ms'], timing['db_ms'], timing['db_queries'],
+                timing['serialize_ms'], timing['render_ms'], timing['size'],
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        """Measure how long the response takes to render"""
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._render_seconds = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
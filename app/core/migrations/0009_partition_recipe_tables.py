@@ -0,0 +1,100 @@
+"""
+Convert core_recipe and its M2M tables to hash partitioned tables.
+
+core_recipe is partitioned by user_id. The M2M tables have no user_id
+column, so they are partitioned by recipe_id instead. Postgres can't
+reference a partitioned table by id alone, so the M2M -> recipe foreign
+keys are dropped; Django already deletes M2M rows itself when a recipe is
+deleted. Primary keys become (id, partition key).
+
+Only runs on PostgreSQL. The data is copied in the migration, so on large
+tables run it in a maintenance window.
+"""
+from django.db import migrations
+
+PARTITIONS = 16
+
+TABLES = [
+    {
+        'table': 'core_recipe',
+        'key': 'user_id',
+        'foreign_keys': [('user_id', 'core_user')],
+        'unique': [],
+        'indexes': ['user_id'],
+    },
+    {
+        'table': 'core_recipe_tag',
+        'key': 'recipe_id',
+        'foreign_keys': [('tag_id', 'core_tag')],
+        'unique': [('recipe_id', 'tag_id')],
+        'indexes': ['tag_id'],
+    },
+    {
+        'table': 'core_recipe_ingredients',
+        'key': 'recipe_id',
+        'foreign_keys': [('ingredient_id', 'core_ingredient')],
+        'unique': [('recipe_id', 'ingredient_id')],
+        'indexes': ['ingredient_id'],
+    },
+]
+
+
+def partition_table(cursor, table, key, foreign_keys, unique, indexes):
+    """Replace table with a hash partitioned copy of itself"""
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+    cursor.execute(
+        f'CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS) '
+        f'PARTITION BY HASH ({key})'
+    )
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+    cursor.execute(
+        f'ALTER TABLE {table} ADD CONSTRAINT {table}_part_pkey '
+        f'PRIMARY KEY (id, {key})'
+    )
+    for columns in unique:
+        name = f'{table}_{"_".join(columns)}_part_uniq'
+        cursor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} '
+            f'UNIQUE ({", ".join(columns)})'
+        )
+    for column, target in foreign_keys:
+        cursor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_part_fk '
+            f'FOREIGN KEY ({column}) REFERENCES {target} (id) '
+            f'DEFERRABLE INITIALLY DEFERRED'
+        )
+    for column in indexes:
+        cursor.execute(
+            f'CREATE INDEX {table}_{column}_part_idx ON {table} ({column})'
+        )
+    for remainder in range(PARTITIONS):
+        cursor.execute(
+            f'CREATE TABLE {table}_p{remainder} PARTITION OF {table} '
+            f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+        )
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {table}_old')
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for spec in TABLES:
+            partition_table(cursor, **spec)
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        for spec in reversed(TABLES):
+            cursor.execute(f'DROP TABLE {spec["table"]}_old CASCADE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_usershard'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_partition_recipe_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(help_text='Resolved view name, e.g. recipe:recipe-list', max_length=255)),
+                ('sample_rate', models.FloatField(default=0.01, help_text='Fraction of requests to profile (0-1)')),
+                ('enabled', models.BooleanField(default=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:23
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce({row}description, '')), 'B')"
+)
+
+FORWARD_SQL = [
+    f"""
+    CREATE FUNCTION core_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER core_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON core_recipe
+    FOR EACH ROW EXECUTE FUNCTION core_recipe_search_vector_update()
+    """,
+    f"UPDATE core_recipe SET search_vector = {SEARCH_VECTOR_SQL.format(row='')}",
+    'CREATE INDEX recipe_search_idx ON core_recipe USING gin (search_vector)',
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS recipe_search_idx',
+    'DROP TRIGGER IF EXISTS core_recipe_search_vector_trigger ON core_recipe',
+    'DROP FUNCTION IF EXISTS core_recipe_search_vector_update()',
+]
+
+
+def run_postgres(statements):
+    """Run statements on PostgreSQL, the column stays empty elsewhere"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_profilingrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(
+                    run_postgres(FORWARD_SQL),
+                    run_postgres(REVERSE_SQL),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:25
+
+import django.contrib.postgres.indexes
+import django.db.models.expressions
+import django.db.models.functions.text
+from django.contrib.postgres.operations import (
+    BtreeGinExtension,
+    TrigramExtension,
+)
+from django.db import migrations, models
+
+FORWARD_SQL = [
+    'CREATE INDEX ingredient_user_name_trgm_idx ON core_ingredient '
+    'USING gin (user_id, name gin_trgm_ops)',
+    'CREATE INDEX tag_user_name_trgm_idx ON core_tag '
+    'USING gin (user_id, name gin_trgm_ops)',
+    'CREATE INDEX ingredient_user_name_upper_idx ON core_ingredient '
+    '(user_id, UPPER(name::text) text_pattern_ops)',
+    'CREATE INDEX tag_user_name_upper_idx ON core_tag '
+    '(user_id, UPPER(name::text) text_pattern_ops)',
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS ingredient_user_name_trgm_idx',
+    'DROP INDEX IF EXISTS tag_user_name_trgm_idx',
+    'DROP INDEX IF EXISTS ingredient_user_name_upper_idx',
+    'DROP INDEX IF EXISTS tag_user_name_upper_idx',
+]
+
+
+def run_postgres(statements):
+    """Run statements on PostgreSQL, other databases go without the index"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_search'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        BtreeGinExtension(),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='ingredient',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'name'], name='ingredient_user_name_trgm_idx', opclasses=['int8_ops', 'gin_trgm_ops']),
+                ),
+                migrations.AddIndex(
+                    model_name='ingredient',
+                    index=models.Index(django.db.models.expressions.F('user'), django.db.models.functions.text.Upper('name'), name='ingredient_user_name_upper_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'name'], name='tag_user_name_trgm_idx', opclasses=['int8_ops', 'gin_trgm_ops']),
+                ),
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=models.Index(django.db.models.expressions.F('user'), django.db.models.functions.text.Upper('name'), name='tag_user_name_upper_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(
+                    run_postgres(FORWARD_SQL),
+                    run_postgres(REVERSE_SQL),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipesimilarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to='core.user')),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_time_minutes', models.BigIntegerField(default=0)),
+                ('tag_count', models.IntegerField(default=0)),
+                ('ingredient_count', models.IntegerField(default=0)),
+                ('tag_usage', models.JSONField(default=dict)),
+                ('top_tags', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -7,7 +7,11 @@ import uuid
 import os
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -69,6 +73,27 @@ class Recipe(models.Model):
     tag=models.ManyToManyField('Tag')
     ingredients=models.ManyToManyField('Ingredient')
     image=models.ImageField(null=True,upload_to=recipe_image_file_path)
+    # maintained by a database trigger from title and description
+    search_vector=SearchVectorField(null=True,editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'],name='recipe_search_idx'),
+            # range filters and ?ordering= of the recipe list, id keeps
+            # keyset pagination on the index
+            models.Index(
+                fields=['user','price','id'],
+                name='recipe_user_price_idx',
+            ),
+            models.Index(
+                fields=['user','time_minutes','id'],
+                name='recipe_user_time_idx',
+            ),
+            models.Index(
+                fields=['user','title','id'],
+                name='recipe_user_title_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -82,6 +107,23 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        # PostgreSQL only, created in migration 0012: the prefix index is
+        # (user_id, UPPER(name) text_pattern_ops) for istartswith, the
+        # trigram one needs btree_gin for user_id
+        indexes = [
+            GinIndex(
+                fields=['user', 'name'],
+                name='tag_user_name_trgm_idx',
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+            ),
+            models.Index(
+                F('user'),
+                Upper('name'),
+                name='tag_user_name_upper_idx',
+            ),
+        ]
+
     def __str__(self) -> str:
         return self.name
 
@@ -94,5 +136,116 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        # PostgreSQL only, created in migration 0012: the prefix index is
+        # (user_id, UPPER(name) text_pattern_ops) for istartswith, the
+        # trigram one needs btree_gin for user_id
+        indexes = [
+            GinIndex(
+                fields=['user', 'name'],
+                name='ingredient_user_name_trgm_idx',
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+            ),
+            models.Index(
+                F('user'),
+                Upper('name'),
+                name='ingredient_user_name_upper_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class RecipeSimilarity(models.Model):
+    """A precomputed neighbour of a recipe, scored by shared tags/ingredients
+
+    core_recipe is partitioned on PostgreSQL and can't be referenced by id
+    alone, so the foreign keys are only enforced by Django.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='similarities',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='similar_to',
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='recipe_similarity_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='recipe_similarity_top_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id} ~ {self.similar_id} ({self.score:.2f})'
+
+
+class UserRecipeStats(models.Model):
+    """Dashboard totals of a user's recipe data, kept current on writes"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats',
+    )
+    recipe_count = models.IntegerField(default=0)
+    total_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+    )
+    total_time_minutes = models.BigIntegerField(default=0)
+    tag_count = models.IntegerField(default=0)
+    ingredient_count = models.IntegerField(default=0)
+    # {tag id: number of recipes}, and the names of the most used ones
+    tag_usage = models.JSONField(default=dict)
+    top_tags = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.user_id}: {self.recipe_count} recipes'
+
+
+class UserShard(models.Model):
+    """Database shard holding a user's recipe data"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shard',
+    )
+    alias = models.CharField(max_length=64, default='default')
+    moving = models.BooleanField(default=False)
+
+    def __str__(self) -> str:
+        return f'{self.user_id} -> {self.alias}'
+
+
+class ProfilingRule(models.Model):
+    """Profile a sample of live requests to a view"""
+    view_name = models.CharField(
+        max_length=255,
+        help_text='Resolved view name, e.g. recipe:recipe-list',
+    )
+    sample_rate = models.FloatField(
+        default=0.01,
+        help_text='Fraction of requests to profile (0-1)',
+    )
+    enabled = models.BooleanField(default=True)
+
     def __str__(self) -> str:
-        return self.name
\ No newline at end of file
+        return f'{self.view_name} @ {self.sample_rate}'
@@ -0,0 +1,253 @@
+"""
+On-demand profiling of live requests
+
+Staff can profile a single request by sending `X-Profile: sample` (stack
+sampler, flame graph output) or `X-Profile: cprofile`. ProfilingRule rows
+edited in the admin profile a fraction of requests to a view. Profiles are
+written to PROFILE_ROOT and listed at /api/profiles/.
+
+The rules are kept in process memory. A background thread per worker
+re-reads them every RULES_REFRESH_SECONDS and saving a rule reloads them
+in the worker that saved it, so requests never query for them.
+"""
+import cProfile
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import DatabaseError
+from django.http import FileResponse, Http404
+from django.urls import Resolver404, resolve
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.authentication import MeteredTokenAuthentication
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+RULES_REFRESH_SECONDS = 30
+
+logger = logging.getLogger('app.profiling')
+
+_rules_lock = threading.Lock()
+_rules = {'loaded_at': None, 'generation': 0, 'rates': {}}
+_rules_thread = None
+
+
+class StackSampler:
+    """Sample the stack of one thread at a fixed interval"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = Counter()
+        self.thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        """Write collapsed stacks, the input format of flame graph tools"""
+        with open(path, 'w') as out:
+            for stack, count in self.counts.most_common():
+                out.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+    """cProfile behind the same interface as StackSampler"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+PROFILERS = {
+    'sample': (StackSampler, 'collapsed'),
+    'cprofile': (CProfiler, 'prof'),
+}
+
+
+def load_rates():
+    """Return {view_name: rate} of the enabled rules"""
+    from core.models import ProfilingRule
+    return dict(
+        ProfilingRule.objects.filter(enabled=True)
+        .values_list('view_name', 'sample_rate')
+    )
+
+
+def refresh_rates():
+    """Re-read the rules unless this process loaded them recently"""
+    with _rules_lock:
+        loaded_at = _rules['loaded_at']
+        generation = _rules['generation']
+    if (loaded_at is not None
+            and time.monotonic() - loaded_at < RULES_REFRESH_SECONDS):
+        return
+    try:
+        rates = load_rates()
+    except DatabaseError:
+        logger.exception('Loading profiling rules failed')
+        return
+    finally:
+        connections.close_all()
+    with _rules_lock:
+        # a rule saved meanwhile was loaded by its handler, keep that
+        if _rules['generation'] == generation:
+            _rules['rates'] = rates
+            _rules['loaded_at'] = time.monotonic()
+
+
+def rules_worker():
+    """Keep this process's rules current, off the request path"""
+    while True:
+        refresh_rates()
+        time.sleep(RULES_REFRESH_SECONDS)
+
+
+def start_rules_thread():
+    global _rules_thread
+    with _rules_lock:
+        if _rules_thread is None or not _rules_thread.is_alive():
+            _rules_thread = threading.Thread(
+                target=rules_worker,
+                daemon=True,
+            )
+            _rules_thread.start()
+
+
+def reload_rates(**kwargs):
+    """post_save/post_delete handler for ProfilingRule"""
+    rates = load_rates()
+    with _rules_lock:
+        _rules['rates'] = rates
+        _rules['loaded_at'] = time.monotonic()
+        _rules['generation'] += 1
+
+
+def sampled_by_rule(request):
+    """Return True if a ProfilingRule picks this request"""
+    # workers are forked from the master, so start the thread on first use
+    if _rules_thread is None or not _rules_thread.is_alive():
+        start_rules_thread()
+    rates = _rules['rates']
+    if not rates:
+        return False
+    try:
+        view_name = resolve(request.path_info).view_name
+    except Resolver404:
+        return False
+    return random.random() < rates.get(view_name, 0)
+
+
+def header_user(request):
+    """Resolve the token user before the view runs, None if there is none"""
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+class ProfilingMiddleware:
+    """Run a profiler around requests that asked for or were sampled"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get(PROFILE_HEADER)
+        if mode in PROFILERS:
+            # only staff may profile on demand, check before starting
+            user = header_user(request)
+            if user is None or not user.is_staff:
+                mode = None
+        else:
+            mode = None
+        if mode is None and sampled_by_rule(request):
+            mode = 'sample'
+        if mode is None:
+            return self.get_response(request)
+
+        profiler_class, ext = PROFILERS[mode]
+        profiler = profiler_class()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+
+        match = request.resolver_match
+        view = (match.view_name if match else 'unmatched')
+        name = f'{time.time():.3f}-{view.replace(":", "_")}.{ext}'
+        settings.PROFILE_ROOT.mkdir(parents=True, exist_ok=True)
+        profiler.dump(settings.PROFILE_ROOT / name)
+        response['X-Profile-Id'] = name
+        return response
+
+
+class ProfileListView(APIView):
+    """List stored profiles, newest first"""
+    authentication_classes = [MeteredTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        operation_id='profiles_list',
+        responses={200: {'type': 'array', 'items': {'type': 'string'}}},
+    )
+    def get(self, request):
+        root = settings.PROFILE_ROOT
+        names = sorted(
+            (path.name for path in root.glob('*.*')) if root.exists() else [],
+            reverse=True,
+        )
+        return Response(names)
+
+
+class ProfileDetailView(APIView):
+    """Download a stored profile"""
+    authentication_classes = [MeteredTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        operation_id='profiles_retrieve',
+        responses={(200, 'text/plain'): OpenApiTypes.STR},
+    )
+    def get(self, request, name):
+        path = settings.PROFILE_ROOT / name
+        if '/' in name or not path.is_file():
+            raise Http404
+        return FileResponse(open(path, 'rb'), content_type='text/plain')
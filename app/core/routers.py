@@ -0,0 +1,110 @@
+"""
+Database routers
+
+"""
+import random
+import time
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+from django.db.utils import DatabaseError
+
+from core.sharding import current_shard, is_sharded
+
+_state = Local()
+_lag_cache = {}
+
+REPLICA_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+    "END"
+)
+
+
+def replica_aliases():
+    """Return the configured replica database aliases"""
+    return [
+        alias for alias in settings.DATABASES
+        if alias != 'default' and alias not in settings.DB_SHARDS
+    ]
+
+
+def replica_lag(alias):
+    """Return replication lag in seconds, cached per process for a while"""
+    now = time.monotonic()
+    cached = _lag_cache.get(alias)
+    if cached and now - cached[0] < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+        return cached[1]
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = float(cursor.fetchone()[0] or 0)
+    except DatabaseError:
+        lag = float('inf')
+    _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def choose_replica():
+    """Pick a replica that is keeping up, or None to use the primary"""
+    healthy = [
+        alias for alias in replica_aliases()
+        if replica_lag(alias) <= settings.DB_REPLICA_MAX_LAG
+    ]
+    return random.choice(healthy) if healthy else None
+
+
+def set_read_database(alias):
+    """Route reads of the current request to alias (None for primary)"""
+    _state.read_db = alias
+
+
+class ReplicaRouter:
+    """Send reads to the replica picked for the request, writes to primary"""
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'read_db', None) or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ShardRouter:
+    """Send recipe data to the shard of the user it belongs to
+
+    Returns None for everything else (and for users on the default shard)
+    so the next router decides.
+    """
+
+    def _db_for(self, model, **hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)):
+            alias = instance._state.db
+        else:
+            alias = current_shard()
+        if alias == 'default':
+            return None
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db != 'default' and db in settings.DB_SHARDS:
+            return True
+        return None
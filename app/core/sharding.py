@@ -0,0 +1,115 @@
+"""
+Shard map placing each user's recipe data on one database
+
+"""
+import copy
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from core.metrics import record_cache
+
+_state = Local()
+
+SHARDED_MODELS = {
+    'recipe',
+    'tag',
+    'ingredient',
+    'recipe_tag',
+    'recipe_ingredients',
+    'recipesimilarity',
+    'userrecipestats',
+}
+SHARD_CACHE_TIMEOUT = 300
+
+
+def is_sharded(model):
+    """Return True if rows of model live on the owner's shard"""
+    return (
+        model._meta.app_label == 'core'
+        and model._meta.model_name in SHARDED_MODELS
+    )
+
+
+def current_shard():
+    """Return the shard selected for the current request, if any"""
+    return getattr(_state, 'shard', None)
+
+
+def use_shard(alias):
+    """Select the shard for the current request (None to clear)"""
+    _state.shard = alias
+
+
+def _cache_key(user_id):
+    return f'user-shard:{user_id}'
+
+
+def shard_for_user(user_id, fresh=False):
+    """Return (alias, moving) for a user, users without a row on default
+
+    The cache is per process and a move only clears it in one of them, so
+    writes pass fresh=True to read the stored placement.
+    """
+    key = _cache_key(user_id)
+    placement = None if fresh else cache.get(key)
+    if not fresh:
+        record_cache('user_shard', placement is not None)
+    if placement is None:
+        from core.models import UserShard
+        row = UserShard.objects.using('default').filter(
+            user_id=user_id,
+        ).values_list('alias', 'moving').first()
+        placement = tuple(row) if row else ('default', False)
+        cache.set(key, placement, SHARD_CACHE_TIMEOUT)
+    return placement
+
+
+def set_shard(user_id, alias, moving=False):
+    """Record where a user's data lives and drop the cached placement"""
+    from core.models import UserShard
+    UserShard.objects.using('default').update_or_create(
+        user_id=user_id,
+        defaults={'alias': alias, 'moving': moving},
+    )
+    cache.delete(_cache_key(user_id))
+
+
+def place_new_user(user_id):
+    """Pick a shard for a new user from the configured DB_SHARDS"""
+    shards = settings.DB_SHARDS
+    return shards[user_id % len(shards)]
+
+
+def mirror_user(user, alias):
+    """Copy the user row to a shard so foreign keys there resolve"""
+    if alias == 'default':
+        return
+    mirror = copy.copy(user)
+    mirror._state = copy.copy(user._state)
+    mirror.save(using=alias)
+
+
+def assign_shard_on_save(sender, instance, created, using, **kwargs):
+    """post_save handler placing new users and keeping mirrors current"""
+    if using != 'default':
+        return
+    if created:
+        if len(settings.DB_SHARDS) == 1:
+            return
+        alias = place_new_user(instance.pk)
+        set_shard(instance.pk, alias)
+    else:
+        alias, _ = shard_for_user(instance.pk)
+    mirror_user(instance, alias)
+
+
+def connect_signals():
+    """Hook shard placement into user creation"""
+    models.signals.post_save.connect(
+        assign_shard_on_save,
+        sender=settings.AUTH_USER_MODEL,
+        dispatch_uid='core.sharding.assign_shard_on_save',
+    )
@@ -0,0 +1,228 @@
+"""
+Slow query capture
+
+Every database connection gets an execute wrapper that times queries.
+Queries slower than SLOW_QUERY_MS are logged, attributed to the view or
+project code that ran them and aggregated by normalized SQL fingerprint.
+With SLOW_QUERY_EXPLAIN_RATE set, a sample of slow SELECTs gets
+`EXPLAIN (ANALYZE, BUFFERS)` run on a background thread so the request
+isn't held up. ANALYZE executes the query again, so locking reads and
+SELECTs calling sequence or advisory lock functions are never sampled.
+
+The aggregate is per process; /api/slow-queries/ shows the worker that
+served the request.
+"""
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import DatabaseError
+from django.views import View
+from drf_spectacular.utils import extend_schema, inline_serializer
+from rest_framework import serializers
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import middleware
+from core.authentication import MeteredTokenAuthentication
+
+logger = logging.getLogger('app.slow_query')
+
+_lock = threading.Lock()
+_stats = {}
+_explain_queue = queue.Queue(maxsize=100)
+_explain_thread = None
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s|\?')
+IN_LIST_RE = re.compile(r'IN \(\?(?:, \?)*\)')
+SIDE_EFFECT_RE = re.compile(
+    r'\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b'
+    r'|\b(?:nextval|setval|pg_advisory\w*)\s*\(',
+    re.IGNORECASE,
+)
+
+
+def fingerprint(sql):
+    """Normalize SQL so queries differing only in values group together"""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+def explainable(sql):
+    """Return True if running sql again under EXPLAIN ANALYZE is harmless"""
+    return (sql.lstrip().upper().startswith('SELECT')
+            and not SIDE_EFFECT_RE.search(sql))
+
+
+def call_site():
+    """Return the project code or view that issued the current query"""
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if 'execute' in frame.f_locals and 'sql' in frame.f_locals:
+            # another execute wrapper, e.g. the request timer
+            frame = frame.f_back
+            continue
+        # the middleware frames are timing wrappers, e.g. serializer.data
+        if (filename.startswith(base)
+                and filename not in (__file__, middleware.__file__)
+                and 'site-packages' not in filename):
+            path = filename[len(base):].lstrip('/')
+            return f'{path}:{frame.f_lineno} in {code.co_name}'
+        instance = frame.f_locals.get('self')
+        if isinstance(instance, View):
+            view = type(instance)
+            return f'{view.__module__}.{view.__name__}.{code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def record(alias, sql, params, seconds):
+    """Aggregate a slow query and maybe queue it for EXPLAIN"""
+    key = fingerprint(sql)
+    site = call_site()
+    with _lock:
+        entry = _stats.setdefault(key, {
+            'fingerprint': key,
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'call_sites': Counter(),
+            'plan': None,
+        })
+        entry['count'] += 1
+        entry['total_ms'] += seconds * 1000
+        entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+        entry['call_sites'][site] += 1
+    logger.warning('slow query %.1fms at %s: %s', seconds * 1000, site, key)
+
+    if (settings.SLOW_QUERY_EXPLAIN_RATE
+            and connections[alias].vendor == 'postgresql'
+            and explainable(sql)
+            and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE):
+        try:
+            _explain_queue.put_nowait((alias, key, sql, params))
+        except queue.Full:
+            return
+        start_explain_thread()
+
+
+def explain(alias, key, sql, params):
+    """Attach the EXPLAIN ANALYZE plan of a query to its stats entry"""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+    except DatabaseError as exc:
+        plan = f'EXPLAIN failed: {exc}'
+    with _lock:
+        # reset() may have dropped the entry while EXPLAIN ran
+        entry = _stats.get(key)
+        if entry is not None:
+            entry['plan'] = plan
+
+
+def explain_worker():
+    """Run EXPLAIN ANALYZE for queued queries on this thread's connection"""
+    while True:
+        item = _explain_queue.get()
+        try:
+            explain(*item)
+        except Exception:
+            logger.exception('EXPLAIN of a slow query failed')
+
+
+def start_explain_thread():
+    global _explain_thread
+    with _lock:
+        if _explain_thread is None or not _explain_thread.is_alive():
+            _explain_thread = threading.Thread(
+                target=explain_worker,
+                daemon=True,
+            )
+            _explain_thread.start()
+
+
+class SlowQueryWrapper:
+    """Execute wrapper recording queries over SLOW_QUERY_MS"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            if (seconds * 1000 >= settings.SLOW_QUERY_MS
+                    and not sql.startswith('EXPLAIN')):
+                record(self.alias, sql, params, seconds)
+
+
+def install_wrapper(sender, connection, **kwargs):
+    """connection_created handler adding the wrapper once per connection"""
+    if not any(isinstance(wrapper, SlowQueryWrapper)
+               for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(SlowQueryWrapper(connection.alias))
+
+
+def slow_query_report():
+    """Return the aggregated slow queries, most total time first"""
+    with _lock:
+        entries = [
+            {**entry, 'call_sites': dict(entry['call_sites'])}
+            for entry in _stats.values()
+        ]
+    return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)
+
+
+def reset():
+    """Forget the aggregated slow queries"""
+    with _lock:
+        _stats.clear()
+
+
+class SlowQueryView(APIView):
+    """Slow queries of this worker grouped by fingerprint"""
+    authentication_classes = [MeteredTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        responses=inline_serializer(
+            'SlowQuery',
+            {
+                'fingerprint': serializers.CharField(),
+                'count': serializers.IntegerField(),
+                'total_ms': serializers.FloatField(),
+                'max_ms': serializers.FloatField(),
+                'call_sites': serializers.DictField(
+                    child=serializers.IntegerField(),
+                ),
+                'plan': serializers.CharField(allow_null=True),
+            },
+            many=True,
+        ),
+    )
+    def get(self, request):
+        return Response(slow_query_report())
+
+    @extend_schema(responses={204: None})
+    def delete(self, request):
+        reset()
+        return Response(status=204)
@@ -4,34 +4,78 @@ Test custom Django management commands
 """
 
 
+import tempfile
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as PsycopgError
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 
+from core.management.commands.startup import pending_migrations
 
-@patch('core.management.commands.wait_for_db.Command.check')
+
+@patch('core.management.commands.wait_for_db.Command.probe')
 class CommandTest(SimpleTestCase):
     """Test commands."""
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_probe):
         """Test waiting for  db if db is ready"""
-        patched_check.return_value = True
+        patched_probe.return_value = None
 
         call_command("wait_for_db")
 
-        patched_check.assert_called_once_with(databases =['default'])
+        patched_probe.assert_called_once_with('default')
 
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self,patched_sleep, patched_check):
+    def test_wait_for_db_delay(self,patched_sleep, patched_probe):
         """Test waiting for Database for getting OperationalError"""
-        patched_check.side_effect = [PsycopgError] *2 + \
-            [OperationalError] * 3 + [True]
+        patched_probe.side_effect = [PsycopgError] *2 + \
+            [OperationalError] * 3 + [None]
 
         call_command('wait_for_db')
 
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases =['default'])
\ No newline at end of file
+        self.assertEqual(patched_probe.call_count, 6)
+        patched_probe.assert_called_with('default')
+        delays = [c.args[0] for c in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        self.assertLess(delays[0], delays[-1])
+
+    def test_wait_for_db_timeout(self, patched_probe):
+        """Test giving up once the timeout is reached"""
+        patched_probe.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', timeout=0)
+
+    def test_wait_for_multiple_databases(self, patched_probe):
+        """Test every requested database is probed"""
+        call_command('wait_for_db', database=['default', 'replica1'])
+
+        probed = sorted(c.args[0] for c in patched_probe.call_args_list)
+        self.assertEqual(probed, ['default', 'replica1'])
+
+
+@patch('core.management.commands.startup.call_command')
+class StartupCommandTest(TestCase):
+    """Test the container startup command."""
+
+    def test_no_pending_migrations(self, patched_call):
+        """Test a migrated database has nothing pending"""
+        self.assertEqual(pending_migrations(), set())
+
+    def test_collectstatic_skipped_when_unchanged(self, patched_call):
+        """Test collectstatic only runs when static files changed"""
+        with override_settings(STATIC_ROOT=tempfile.mkdtemp()):
+            call_command('startup')
+            call_command('startup')
+
+        collect_calls = [
+            c for c in patched_call.call_args_list
+            if c.args[0] == 'collectstatic'
+        ]
+        self.assertEqual(len(collect_calls), 1)
+        commands = [c.args[0] for c in patched_call.call_args_list]
+        self.assertNotIn('migrate', commands)
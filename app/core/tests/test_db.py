@@ -0,0 +1,81 @@
+"""
+Test database connection helpers
+
+"""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.db import check_persistent_connections
+
+
+class FakeConnection:
+    """Open database connection counting its health checks"""
+
+    def __init__(self, usable=True, health_checks=True):
+        self.connection = object()
+        self.settings_dict = {'CONN_HEALTH_CHECKS': health_checks}
+        self.usable = usable
+        self.checks = 0
+
+    def is_usable(self):
+        self.checks += 1
+        return self.usable
+
+    def close(self):
+        self.connection = None
+
+    def ensure_connection(self):
+        if self.connection is None:
+            self.connection = object()
+
+
+@patch('core.db.connections')
+class ConnectionHealthCheckTests(SimpleTestCase):
+    """Test persistent connection health checks."""
+
+    def test_unusable_connection_replaced(self, patched_connections):
+        """Test a dead persistent connection is reopened on first use"""
+        conn = FakeConnection(usable=False)
+        dead = conn.connection
+        patched_connections.all.return_value = [conn]
+
+        check_persistent_connections()
+        conn.ensure_connection()
+
+        self.assertEqual(conn.checks, 1)
+        self.assertIsNotNone(conn.connection)
+        self.assertIsNot(conn.connection, dead)
+
+    def test_usable_connection_kept(self, patched_connections):
+        """Test a healthy persistent connection is reused"""
+        conn = FakeConnection()
+        alive = conn.connection
+        patched_connections.all.return_value = [conn]
+
+        check_persistent_connections()
+        conn.ensure_connection()
+
+        self.assertIs(conn.connection, alive)
+
+    def test_checked_once_per_request(self, patched_connections):
+        """Test only the request's first use of a connection pings it"""
+        conn = FakeConnection()
+        patched_connections.all.return_value = [conn]
+
+        check_persistent_connections()
+        self.assertEqual(conn.checks, 0)
+        conn.ensure_connection()
+        conn.ensure_connection()
+
+        self.assertEqual(conn.checks, 1)
+
+    def test_health_checks_disabled(self, patched_connections):
+        """Test connections are not probed when checks are off"""
+        conn = FakeConnection(usable=False, health_checks=False)
+        patched_connections.all.return_value = [conn]
+
+        check_persistent_connections()
+        conn.ensure_connection()
+
+        self.assertEqual(conn.checks, 0)
@@ -0,0 +1,51 @@
+"""
+Test health and readiness probes
+
+"""
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from app import health
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class HealthProbeTests(TestCase):
+    """Test the /healthz and /readyz endpoints."""
+
+    def setUp(self):
+        health._ready['checked_at'] = None
+
+    def test_healthz(self):
+        """Test liveness needs no database or allowed host"""
+        with self.assertNumQueries(0):
+            res = self.client.get('/healthz', HTTP_HOST='10.0.0.1')
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_readyz(self):
+        """Test readiness reports database and media checks"""
+        res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json(),
+            {'status': 'ok', 'database': True, 'media': True},
+        )
+
+    @patch('app.health.check_database', return_value=False)
+    def test_readyz_unavailable(self, patched_check):
+        """Test readiness fails when the database is down"""
+        res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 503)
+
+    @override_settings(READINESS_CACHE_SECONDS=60)
+    @patch('app.health.check_database', return_value=True)
+    def test_readyz_cached(self, patched_check):
+        """Test probe storms reuse the cached checks"""
+        for _ in range(5):
+            self.client.get('/readyz')
+
+        patched_check.assert_called_once()
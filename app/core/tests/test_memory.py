@@ -0,0 +1,59 @@
+"""
+Test worker memory profiling
+
+"""
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import memory
+
+RECIPES_URL = reverse('recipe:recipe-list')
+MEMORY_URL = reverse('memory-report')
+
+
+class MemoryProfilingTests(TestCase):
+    """Test tracemalloc snapshots and the report endpoint."""
+
+    def setUp(self):
+        memory._state.update(
+            requests=0,
+            baseline=None,
+            previous=None,
+            report=None,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                'user@example.com',
+                'testpass123',
+                is_staff=True,
+            )
+        )
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    @override_settings(MEMORY_PROFILE_EVERY=2)
+    def test_snapshots_every_n_requests(self):
+        """Test snapshots are taken and diffed every N requests"""
+        for _ in range(4):
+            self.client.get(RECIPES_URL)
+
+        res = self.client.get(MEMORY_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(tracemalloc.is_tracing())
+        self.assertEqual(res.data['requests'], 4)
+        self.assertIn('since_start', res.data)
+
+    def test_disabled_by_default(self):
+        """Test nothing is traced unless enabled"""
+        self.client.get(RECIPES_URL)
+
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIsNone(memory._state['report'])
@@ -0,0 +1,103 @@
+"""
+Test the Prometheus metrics
+
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('metrics')
+
+
+def sample(name, **labels):
+    """Return the current value of a metric sample, 0 if missing"""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTests(TestCase):
+    """Test metrics are recorded and exposed."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client = APIClient()
+
+    def test_request_metrics(self):
+        """Test requests are counted per route, status and tier"""
+        self.client.force_authenticate(self.user)
+        labels = {
+            'route': 'recipe:recipe-list',
+            'method': 'GET',
+            'status': '200',
+            'tier': 'user',
+        }
+        before = sample('http_request_duration_seconds_count', **labels)
+
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            sample('http_request_duration_seconds_count', **labels),
+            before + 1,
+        )
+
+    def test_token_auth_metrics(self):
+        """Test token lookups are counted by result"""
+        token = Token.objects.create(user=self.user)
+        ok = sample('app_token_auth_total', result='ok')
+        failed = sample('app_token_auth_total', result='failed')
+
+        self.client.get(RECIPES_URL, HTTP_AUTHORIZATION=f'Token {token}')
+        self.client.get(RECIPES_URL, HTTP_AUTHORIZATION='Token bad')
+
+        self.assertEqual(sample('app_token_auth_total', result='ok'), ok + 1)
+        self.assertEqual(
+            sample('app_token_auth_total', result='failed'),
+            failed + 1,
+        )
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint(self):
+        """Test metrics are exposed in the text format"""
+        self.client.force_authenticate(self.user)
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(
+            METRICS_URL,
+            HTTP_AUTHORIZATION='Bearer scrape-secret',
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'http_request_duration_seconds_bucket', res.content)
+        self.assertIn(b'app_cache_requests_total', res.content)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_token_required(self):
+        """Test a configured token must be sent to read metrics"""
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, 403)
+
+        res = self.client.get(
+            METRICS_URL,
+            HTTP_AUTHORIZATION='Bearer wrong',
+        )
+        self.assertEqual(res.status_code, 403)
+
+        res = self.client.get(
+            METRICS_URL,
+            HTTP_AUTHORIZATION='Bearer scrape-secret',
+        )
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_metrics_closed_without_token(self):
+        """Test metrics are not served without a token outside DEBUG"""
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 403)
@@ -0,0 +1,63 @@
+"""
+Test partition pruning on the partitioned recipe tables
+
+"""
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core.models import Recipe, Tag
+
+
+def partitions_scanned(queryset, table):
+    """Return the partitions of table the plan of queryset touches"""
+    plan = queryset.explain()
+    return {
+        word for word in plan.replace('(', ' ').split()
+        if word.startswith(f'{table}_p')
+    }
+
+
+@unittest.skipUnless(
+    connection.vendor == 'postgresql',
+    'partitioning is PostgreSQL only',
+)
+class PartitionPruningTests(TestCase):
+    """Test queries scoped to a user only touch one partition."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('2.00'),
+        )
+        self.recipe.tag.add(Tag.objects.create(user=self.user, name='Hot'))
+
+    def test_recipes_pruned_by_user(self):
+        """Test the recipe list query scans a single partition"""
+        queryset = Recipe.objects.filter(user=self.user).order_by('-id')
+
+        self.assertEqual(len(partitions_scanned(queryset, 'core_recipe')), 1)
+
+    def test_recipe_tags_pruned_by_recipe(self):
+        """Test prefetching tags of a recipe scans a single partition"""
+        queryset = Recipe.tag.through.objects.filter(recipe=self.recipe)
+
+        self.assertEqual(
+            len(partitions_scanned(queryset, 'core_recipe_tag')),
+            1,
+        )
+
+    def test_orm_unchanged(self):
+        """Test recipes still load with their tags"""
+        recipe = Recipe.objects.prefetch_related('tag').get(id=self.recipe.id)
+
+        self.assertEqual([tag.name for tag in recipe.tag.all()], ['Hot'])
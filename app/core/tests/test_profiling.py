@@ -0,0 +1,122 @@
+"""
+Test on-demand request profiling
+
+"""
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import profiling
+from core.models import ProfilingRule
+
+RECIPES_URL = reverse('recipe:recipe-list')
+PROFILES_URL = reverse('profile-list')
+
+
+def create_user(email='user@example.com', **params):
+    """Create and return a sample user"""
+    return get_user_model().objects.create_user(email, 'testpass123', **params)
+
+
+def token_client(user):
+    """Return a client sending the user's API token"""
+    client = APIClient()
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+class ProfilingTests(TestCase):
+    """Test profiling of live requests."""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.settings = override_settings(PROFILE_ROOT=self.root)
+        self.settings.enable()
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings.disable()
+        # the rules are process state, deleting them reloads it empty
+        ProfilingRule.objects.all().delete()
+
+    def test_staff_header_profiles_request(self):
+        """Test staff can profile a request with a header"""
+        self.client = token_client(create_user(is_staff=True))
+
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='sample')
+
+        self.assertTrue((self.root / res['X-Profile-Id']).exists())
+        res = self.client.get(PROFILES_URL)
+        self.assertEqual(len(res.data), 1)
+
+    def test_cprofile_mode(self):
+        """Test cProfile output can be requested"""
+        self.client = token_client(create_user(is_staff=True))
+
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='cprofile')
+
+        self.assertTrue(res['X-Profile-Id'].endswith('.prof'))
+
+    def test_header_ignored_for_users(self):
+        """Test regular users can't store profiles"""
+        self.client = token_client(create_user())
+
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='sample')
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(list(self.root.iterdir()), [])
+        self.assertEqual(self.client.get(PROFILES_URL).status_code, 403)
+
+    def test_rule_samples_requests(self):
+        """Test an admin rule profiles requests to its view"""
+        ProfilingRule.objects.create(
+            view_name='recipe:recipe-list',
+            sample_rate=1,
+        )
+        self.client.force_authenticate(create_user())
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIn('X-Profile-Id', res)
+
+    def test_rules_not_queried_by_requests(self):
+        """Test requests use the rules held in process memory"""
+        ProfilingRule.objects.create(
+            view_name='recipe:recipe-list',
+            sample_rate=1,
+        )
+        self.client.force_authenticate(create_user())
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertIn('X-Profile-Id', res)
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('core_profilingrule', sql)
+        self.assertEqual(
+            profiling._rules['rates'],
+            {'recipe:recipe-list': 1},
+        )
+
+    @patch('core.profiling.CProfiler.start')
+    @patch('core.profiling.StackSampler.start')
+    def test_header_never_starts_profiler_for_non_staff(
+        self, patched_sample, patched_cprofile,
+    ):
+        """Test anonymous and regular users can't start a profiler"""
+        for client in (APIClient(), token_client(create_user())):
+            for mode in ('sample', 'cprofile'):
+                client.get(RECIPES_URL, HTTP_X_PROFILE=mode)
+
+        patched_sample.assert_not_called()
+        patched_cprofile.assert_not_called()
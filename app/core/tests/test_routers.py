@@ -0,0 +1,72 @@
+"""
+Test read replica routing
+
+"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from core import routers
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Recipe
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """Test the database router."""
+
+    def tearDown(self):
+        routers.set_read_database(None)
+
+    def test_reads_default_without_replica(self):
+        """Test reads use the primary when no replica was chosen"""
+        router = routers.ReplicaRouter()
+
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_reads_use_chosen_replica(self):
+        """Test reads follow the replica picked for the request"""
+        router = routers.ReplicaRouter()
+        routers.set_read_database('replica1')
+
+        self.assertEqual(router.db_for_read(Recipe), 'replica1')
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+
+    @patch('core.routers.replica_lag')
+    @patch('core.routers.replica_aliases')
+    def test_lagging_replica_skipped(self, patched_aliases, patched_lag):
+        """Test a replica behind by too much is not chosen"""
+        patched_aliases.return_value = ['replica1']
+        patched_lag.return_value = 60
+
+        self.assertIsNone(routers.choose_replica())
+
+
+@patch('core.middleware.choose_replica', return_value='replica1')
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+    """Test requests are routed and pinned after writes."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+        self.middleware = ReplicaRoutingMiddleware(self.get_response)
+        cache.clear()
+
+    def get_response(self, request):
+        self.seen.append(getattr(routers._state, 'read_db', None))
+        return HttpResponse()
+
+    def test_get_reads_from_replica(self, patched_choose):
+        """Test safe requests read from a replica"""
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token a'))
+
+        self.assertEqual(self.seen, ['replica1'])
+
+    def test_pinned_to_primary_after_write(self, patched_choose):
+        """Test a client reads its own writes from the primary"""
+        self.middleware(self.factory.post('/', HTTP_AUTHORIZATION='Token a'))
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token a'))
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token b'))
+
+        self.assertEqual(self.seen, [None, None, 'replica1'])
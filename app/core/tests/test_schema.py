@@ -0,0 +1,81 @@
+"""
+Test the precomputed OpenAPI schema
+
+"""
+import gzip
+import tempfile
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from drf_spectacular.drainage import GENERATOR_STATS
+
+from app import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaTests(SimpleTestCase):
+    """Test building and serving the schema artifact."""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.settings = override_settings(SCHEMA_ROOT=self.root)
+        self.settings.enable()
+        schema.load_schema.cache_clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        schema.load_schema.cache_clear()
+
+    def test_build_and_check(self):
+        """Test the built artifact passes the check"""
+        call_command('build_schema')
+
+        call_command('build_schema', '--check')
+        self.assertTrue((self.root / 'openapi.yaml.gz').exists())
+
+    def test_build_without_warnings(self):
+        """Test every view is described without guessing"""
+        GENERATOR_STATS.reset()
+
+        call_command('build_schema')
+
+        self.assertFalse(GENERATOR_STATS)
+
+    def test_check_fails_when_stale(self):
+        """Test the check fails when the artifact differs from the code"""
+        call_command('build_schema')
+        (self.root / 'openapi.json').write_bytes(b'{}')
+
+        with self.assertRaises(CommandError):
+            call_command('build_schema', '--check')
+
+    def test_serves_artifact(self):
+        """Test the schema is served from the artifact on disk"""
+        schema.write_schema('yaml', b'openapi: 3.0.3\n')
+
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, b'openapi: 3.0.3\n')
+        self.assertIn('ETag', res)
+
+    def test_gzip_and_not_modified(self):
+        """Test gzip encoding and ETag revalidation"""
+        res = self.client.get(
+            SCHEMA_URL,
+            {'format': 'json'},
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertIn(b'"openapi"', gzip.decompress(res.content))
+
+        res = self.client.get(
+            SCHEMA_URL,
+            {'format': 'json'},
+            HTTP_IF_NONE_MATCH=res['ETag'],
+        )
+        self.assertEqual(res.status_code, 304)
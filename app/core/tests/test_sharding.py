@@ -0,0 +1,173 @@
+"""
+Test sharding of recipe data by user
+
+"""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.models import Recipe, Tag, UserShard
+from core.management.commands.move_user_shard import Command as MoveCommand
+from core.routers import ShardRouter
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_user(email='user@example.com'):
+    """Create and return a sample user"""
+    return get_user_model().objects.create_user(email, 'testpass123')
+
+
+class ShardRouterTests(TestCase):
+    """Test routing of sharded models."""
+
+    def tearDown(self):
+        sharding.use_shard(None)
+
+    def test_recipe_data_follows_request_shard(self):
+        """Test sharded models go to the shard of the request"""
+        router = ShardRouter()
+        sharding.use_shard('shard1')
+
+        self.assertEqual(router.db_for_read(Recipe), 'shard1')
+        self.assertEqual(router.db_for_write(Recipe.tag.through), 'shard1')
+        self.assertIsNone(router.db_for_read(get_user_model()))
+
+    def test_default_shard_defers_to_next_router(self):
+        """Test users on the default shard use normal routing"""
+        router = ShardRouter()
+        sharding.use_shard('default')
+
+        self.assertIsNone(router.db_for_read(Tag))
+
+    def test_instance_hint_wins(self):
+        """Test related writes go where the sharded instance lives"""
+        router = ShardRouter()
+        recipe = Recipe()
+        recipe._state.db = 'shard2'
+        sharding.use_shard('shard1')
+
+        self.assertEqual(
+            router.db_for_write(Recipe.tag.through, instance=recipe),
+            'shard2',
+        )
+
+
+class ShardMapTests(TestCase):
+    """Test the user shard map."""
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_unplaced_user_on_default(self):
+        """Test users without a placement live on the default shard"""
+        user = create_user()
+
+        self.assertEqual(sharding.shard_for_user(user.pk), ('default', False))
+        self.assertFalse(UserShard.objects.exists())
+
+    @override_settings(DB_SHARDS=['default', 'shard1'])
+    @patch('core.sharding.mirror_user')
+    def test_new_user_placed(self, patched_mirror):
+        """Test new users are spread over the configured shards"""
+        get_user_model().objects.create_user('a@example.com', 'pass123')
+        get_user_model().objects.create_user('b@example.com', 'pass123')
+
+        aliases = set(UserShard.objects.values_list('alias', flat=True))
+        self.assertEqual(aliases, {'default', 'shard1'})
+
+    def test_writes_refused_while_moving(self):
+        """Test writes return 503 while the user's data is moved"""
+        user = create_user()
+        sharding.set_shard(user.pk, 'default', moving=True)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.post(RECIPES_URL, {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': Decimal('2.00'),
+        })
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        res = client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_writes_check_stored_placement(self):
+        """Test writes are refused even with a stale cached placement"""
+        user = create_user()
+        sharding.set_shard(user.pk, 'default')
+        sharding.shard_for_user(user.pk)
+        UserShard.objects.filter(user=user).update(moving=True)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.post(RECIPES_URL, {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': Decimal('2.00'),
+        })
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @patch.object(MoveCommand, 'delete_rows')
+    @patch.object(MoveCommand, 'row_counts')
+    @patch.object(MoveCommand, 'copy_rows')
+    @patch('core.management.commands.move_user_shard.mirror_user')
+    def test_move_keeps_source_on_count_mismatch(
+        self, patched_mirror, patched_copy, patched_counts, patched_delete,
+    ):
+        """Test a copy that misses rows leaves the user on the source"""
+        user = create_user()
+        sharding.set_shard(user.pk, 'default')
+        patched_counts.side_effect = lambda user, alias: {
+            'core.Recipe': 2 if alias == 'default' else 1,
+        }
+
+        with override_settings(DB_SHARDS=['default', 'shard1']):
+            with self.assertRaises(CommandError):
+                call_command(
+                    'move_user_shard',
+                    user.email,
+                    to='shard1',
+                    drain_seconds=0,
+                    grace_seconds=0,
+                )
+
+        patched_delete.assert_called_once_with(user, 'shard1')
+        self.assertEqual(
+            sharding.shard_for_user(user.pk, fresh=True),
+            ('default', False),
+        )
+
+    def test_copy_moves_id_sequences(self):
+        """Test rows inserted after a copy don't reuse copied ids"""
+        user = create_user()
+        tag = Tag.objects.create(user=user, name='Vegan')
+        copied = Tag(id=tag.pk + 1, user=user, name='Dessert')
+
+        with patch.object(
+            MoveCommand, 'user_rows', return_value=[(Tag, [copied])],
+        ):
+            MoveCommand().copy_rows(user, 'default', 'default')
+        new = Tag.objects.create(user=user, name='Breakfast')
+
+        self.assertGreater(new.pk, copied.pk)
+
+    def test_move_unknown_shard(self):
+        """Test moving to an unconfigured shard fails"""
+        create_user()
+
+        with self.assertRaises(CommandError):
+            call_command('move_user_shard', 'user@example.com', to='shard9')
@@ -0,0 +1,131 @@
+"""
+Test slow query capture
+
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import slow_queries
+from core.models import Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SLOW_QUERIES_URL = reverse('slow-queries')
+
+
+class FingerprintTests(TestCase):
+    """Test SQL normalization."""
+
+    def test_values_normalized(self):
+        """Test literals and IN lists collapse to one fingerprint"""
+        a = slow_queries.fingerprint(
+            "SELECT * FROM t WHERE id IN (%s, %s) AND name = 'x' LIMIT 21"
+        )
+        b = slow_queries.fingerprint(
+            'SELECT * FROM t WHERE id IN (%s)  AND name = %s LIMIT 5'
+        )
+
+        self.assertEqual(a, b)
+
+    def test_locking_reads_not_explained(self):
+        """Test only side effect free SELECTs are run again for a plan"""
+        self.assertTrue(slow_queries.explainable(
+            'SELECT * FROM core_recipe WHERE id = %s'
+        ))
+        for sql in (
+            'SELECT * FROM core_userrecipestats WHERE user_id = %s '
+            'FOR UPDATE',
+            'SELECT * FROM core_tag FOR NO KEY UPDATE SKIP LOCKED',
+            'SELECT * FROM core_tag FOR share',
+            "SELECT setval(pg_get_serial_sequence('core_tag', 'id'), 5)",
+            'UPDATE core_tag SET name = %s',
+        ):
+            self.assertFalse(slow_queries.explainable(sql), sql)
+
+
+@override_settings(SLOW_QUERY_MS=0)
+class SlowQueryCaptureTests(TestCase):
+    """Test slow queries are aggregated with their call site."""
+
+    def setUp(self):
+        slow_queries.reset()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+            is_staff=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        slow_queries.reset()
+
+    def test_call_site_is_view(self):
+        """Test queries run by DRF are attributed to the view"""
+        with self.assertLogs('app.slow_query', level='WARNING'):
+            self.client.get(RECIPES_URL)
+
+        sites = set()
+        for entry in slow_queries.slow_query_report():
+            sites.update(entry['call_sites'])
+        self.assertIn('recipe.views.RecipeViewSet.list', sites)
+
+    def test_queries_aggregated(self):
+        """Test repeated queries share one fingerprint"""
+        with self.assertLogs('app.slow_query', level='WARNING'):
+            Tag.objects.filter(id=1).first()
+            Tag.objects.filter(id=2).first()
+
+        entries = [
+            entry for entry in slow_queries.slow_query_report()
+            if 'core_tag' in entry['fingerprint']
+        ]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['count'], 2)
+
+    def test_report_endpoint(self):
+        """Test staff can read the report"""
+        with self.assertLogs('app.slow_query', level='WARNING'):
+            Tag.objects.count()
+
+        res = self.client.get(SLOW_QUERIES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data[0]['count'], 1)
+
+
+class StopWorker(BaseException):
+    """Raised by the test queue to end the EXPLAIN loop"""
+
+
+class ExplainWorkerTests(TestCase):
+    """Test the background EXPLAIN thread."""
+
+    def tearDown(self):
+        slow_queries.reset()
+
+    def test_explain_after_reset(self):
+        """Test a plan for an entry dropped by reset() is discarded"""
+        slow_queries.reset()
+
+        slow_queries.explain('default', 'SELECT ?', 'SELECT 1', None)
+
+        self.assertEqual(slow_queries.slow_query_report(), [])
+
+    @patch('core.slow_queries.explain')
+    def test_worker_survives_errors(self, patched_explain):
+        """Test one failing item doesn't stop the worker"""
+        item = ('default', 'SELECT ?', 'SELECT 1', None)
+        patched_explain.side_effect = [RuntimeError('boom'), None]
+
+        with patch.object(slow_queries._explain_queue, 'get') as get:
+            get.side_effect = [item, item, StopWorker()]
+            with self.assertLogs('app.slow_query', level='ERROR'):
+                with self.assertRaises(StopWorker):
+                    slow_queries.explain_worker()
+
+        self.assertEqual(patched_explain.call_count, 2)
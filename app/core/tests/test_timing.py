@@ -0,0 +1,80 @@
+"""
+Test per-request timing instrumentation
+
+"""
+import itertools
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_user(**params):
+    """Create and return a sample user"""
+    return get_user_model().objects.create_user(
+        'user@example.com',
+        'testpass123',
+        **params,
+    )
+
+
+class RequestTimingTests(TestCase):
+    """Test the request timing middleware."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_server_timing_for_staff(self):
+        """Test staff users get a Server-Timing breakdown"""
+        self.client.force_authenticate(create_user(is_staff=True))
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIn('db;dur=', res['Server-Timing'])
+        self.assertIn('serialize;dur=', res['Server-Timing'])
+        self.assertIn('render;dur=', res['Server-Timing'])
+
+    def test_no_server_timing_for_users(self):
+        """Test regular users don't see timing headers"""
+        self.client.force_authenticate(create_user())
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+        self.assertEqual(res.wsgi_request.timing['view'], 'recipe:recipe-list')
+        self.assertGreater(res.wsgi_request.timing['db_queries'], 0)
+
+    def test_serialize_time_measured(self):
+        """Test building serializer.data is timed apart from rendering"""
+        user = create_user()
+        self.client.force_authenticate(user)
+        Recipe.objects.create(
+            user=user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('2.00'),
+        )
+
+        with patch('core.middleware.time.perf_counter') as clock:
+            clock.side_effect = itertools.count()
+            res = self.client.get(RECIPES_URL)
+
+        self.assertGreater(res.wsgi_request.timing['serialize_ms'], 0)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_logged(self):
+        """Test requests over the threshold are logged"""
+        self.client.force_authenticate(create_user())
+
+        with self.assertLogs('app.timing', level='WARNING') as logs:
+            self.client.get(RECIPES_URL)
+
+        self.assertIn('view=recipe:recipe-list', logs.output[0])
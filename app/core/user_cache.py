@@ -0,0 +1,30 @@
+"""
+Per-user cache versions, bumped whenever the user's recipe data changes
+"""
+from django.core.cache import cache
+
+
+def _version_key(user_id):
+    return f'user-cache-version:{user_id}'
+
+
+def user_cache_version(user_id):
+    """Return the version to put in keys of the user's cached results"""
+    return cache.get(_version_key(user_id), 1)
+
+
+def bump_user_cache_version(sender, instance, **kwargs):
+    """Orphan every cached result of the instance's user"""
+    key = _version_key(instance.user_id)
+    cache.add(key, 1, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr, the next read starts over
+        pass
+
+
+def bump_on_m2m_change(sender, instance, action, **kwargs):
+    """Bump once a recipe's tags or ingredients have changed"""
+    if action.startswith('post_'):
+        bump_user_cache_version(sender, instance)
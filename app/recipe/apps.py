@@ -1,6 +1,37 @@
 from django.apps import AppConfig
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 
 
 class RecipeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipe'
+
+    def ready(self):
+        from core.models import Ingredient, Recipe, Tag
+        from recipe import similarity, stats
+        pre_save.connect(stats.recipe_pre_save, sender=Recipe)
+        post_save.connect(stats.recipe_saved, sender=Recipe)
+        pre_delete.connect(stats.recipe_pre_delete, sender=Recipe)
+        post_delete.connect(stats.recipe_deleted, sender=Recipe)
+        m2m_changed.connect(
+            stats.recipe_tags_changed,
+            sender=Recipe.tag.through,
+        )
+        post_save.connect(stats.tag_saved, sender=Tag)
+        post_delete.connect(stats.tag_deleted, sender=Tag)
+        post_save.connect(stats.ingredient_saved, sender=Ingredient)
+        post_delete.connect(stats.ingredient_deleted, sender=Ingredient)
+        for through in (Recipe.tag.through, Recipe.ingredients.through):
+            m2m_changed.connect(
+                similarity.recipe_features_changed,
+                sender=through,
+            )
+        for model in (Tag, Ingredient):
+            pre_delete.connect(similarity.feature_pre_delete, sender=model)
+            post_delete.connect(similarity.feature_deleted, sender=model)
@@ -2,11 +2,43 @@
 Serializers for recipe api
 """
 
-from rest_framework import serializers
+from decimal import Decimal
 
-from core.models import (Recipe,Tag, Ingredient)
+from rest_framework import serializers
 
-class IngredientSerializer(serializers.ModelSerializer):
+from core.middleware import TimedSerializerMixin
+from core.models import (Recipe,Tag, Ingredient, UserRecipeStats)
+
+
+def requested_fields(query_params,fields):
+    """Resolve ?fields= / ?exclude= against the available field names"""
+    wanted=query_params.get('fields')
+    excluded=query_params.get('exclude')
+    selected=list(fields)
+    if wanted:
+        names=[name.strip() for name in wanted.split(',')]
+        selected=[name for name in selected if name in names]
+    if excluded:
+        names=[name.strip() for name in excluded.split(',')]
+        selected=[name for name in selected if name not in names]
+    if 'id' not in selected:
+        selected.insert(0,'id')
+    return selected
+
+
+class SparseFieldsMixin:
+    """Drop fields not asked for with ?fields= / ?exclude= on reads"""
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        request=self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        keep=requested_fields(request.query_params,self.fields.keys())
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+class IngredientSerializer(TimedSerializerMixin,serializers.ModelSerializer):
     """Serializer for ingredient"""
     class Meta:
         model=Ingredient
@@ -14,7 +46,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin,serializers.ModelSerializer):
 
     class Meta:
         model=Tag
@@ -22,7 +54,24 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
     
 
-class RecipeSerializer(serializers.ModelSerializer):
+class IngredientCountSerializer(IngredientSerializer):
+    """Ingredient with the number of recipes using it"""
+    recipe_count=serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields=IngredientSerializer.Meta.fields+['recipe_count']
+
+
+class TagCountSerializer(TagSerializer):
+    """Tag with the number of recipes using it"""
+    recipe_count=serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields=TagSerializer.Meta.fields+['recipe_count']
+
+
+class RecipeSerializer(TimedSerializerMixin,SparseFieldsMixin,
+                       serializers.ModelSerializer):
     """ serialzers for Recipe app"""
     tag =TagSerializer(many=True, required=False)
     ingredients=IngredientSerializer(many=True,required=False)
@@ -89,8 +138,33 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description' ,'image']
 
 
+class RecipeSearchSerializer(RecipeSerializer):
+    """Recipe list entry with the ?search= rank and highlighted snippet"""
+    rank=serializers.SerializerMethodField()
+    title_headline=serializers.SerializerMethodField()
+    headline=serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            'rank','title_headline','headline',
+        ]
+
+    def get_rank(self,obj):
+        return getattr(obj,'rank',None)
+
+    def _headlines(self,obj):
+        """(title, description) snippets the view looked up for the page"""
+        return self.context.get('headlines',{}).get(obj.id,(None,None))
+
+    def get_title_headline(self,obj):
+        return self._headlines(obj)[0]
+
+    def get_headline(self,obj):
+        return self._headlines(obj)[1]
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+
+
+class RecipeImageSerializer(TimedSerializerMixin,serializers.ModelSerializer):
     """Serializers for uploading Image to recipe """
 
     class Meta:
@@ -100,5 +174,55 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         extra_kwargs={'image':{'required':'True'}}
 
 
+class CookableRecipeSerializer(TimedSerializerMixin,
+                               serializers.ModelSerializer):
+    """Recipe ranked by the ingredients the user has on hand"""
+    covered=serializers.IntegerField(read_only=True)
+    missing=IngredientSerializer(
+        source='missing_ingredients',
+        many=True,
+        read_only=True,
+    )
+
+    class Meta:
+        model=Recipe
+        fields=['id','title','time_minutes','price','link','covered','missing']
+        read_only_fields=fields
+
+
+class SimilarRecipeSerializer(TimedSerializerMixin,
+                              serializers.ModelSerializer):
+    """Recipe from the similarity index with its score"""
+    score=serializers.FloatField(read_only=True)
 
+    class Meta:
+        model=Recipe
+        fields=['id','title','time_minutes','price','link','score']
+        read_only_fields=fields
+
+
+class UserRecipeStatsSerializer(TimedSerializerMixin,
+                                serializers.ModelSerializer):
+    """Dashboard stats of the user's recipes"""
+    average_price=serializers.SerializerMethodField()
+    average_time_minutes=serializers.SerializerMethodField()
 
+    class Meta:
+        model=UserRecipeStats
+        fields=[
+            'recipe_count','average_price','average_time_minutes',
+            'tag_count','ingredient_count','top_tags','updated_at',
+        ]
+        read_only_fields=fields
+
+    def get_average_price(self,obj) -> str:
+        if not obj.recipe_count:
+            return None
+        return str(
+            (obj.total_price/obj.recipe_count).quantize(Decimal('0.01'))
+        )
+
+    def get_average_time_minutes(self,obj) -> float:
+        if not obj.recipe_count:
+            return None
+        return round(obj.total_time_minutes/obj.recipe_count,1)
@@ -0,0 +1,174 @@
+"""
+Similar recipes, scored by Jaccard overlap of their tags and ingredients.
+
+The top SIMILAR_RECIPES neighbours of every recipe are stored in
+RecipeSimilarity so reads are a single indexed lookup. `build_similarity`
+rebuilds a user's index in one pass. Signal handlers run update_recipe()
+when a recipe's tags or ingredients change, including through a deleted
+tag or ingredient: the recipe's own list is recomputed and it is inserted
+into the lists of recipes it now ranks in. A recipe that drops out of a
+neighbour's list leaves that list short until the next rebuild, as do
+bulk writes that send no signals.
+"""
+import heapq
+from collections import defaultdict
+
+from django.db import router, transaction
+
+from core.models import Recipe, RecipeSimilarity
+
+SIMILAR_RECIPES = 10
+
+FEATURES = (
+    ('tag', Recipe.tag.through, 'tag_id'),
+    ('ingredient', Recipe.ingredients.through, 'ingredient_id'),
+)
+FEATURE_LINKS = {kind: (through, column) for kind, through, column in FEATURES}
+THROUGH_COLUMNS = {through: column for _, through, column in FEATURES}
+
+
+def recipe_features(**filters):
+    """Return {recipe_id: {(kind, id), ...}} for matching M2M rows"""
+    features = defaultdict(set)
+    for kind, through, column in FEATURES:
+        rows = through.objects.filter(**filters).values_list(
+            'recipe_id',
+            column,
+        )
+        for recipe_id, value in rows:
+            features[recipe_id].add((kind, value))
+    return features
+
+
+def jaccard(a, b):
+    """Shared features over all features of the two recipes"""
+    shared = len(a & b)
+    if not shared:
+        return 0.0
+    return shared / (len(a) + len(b) - shared)
+
+
+def top_similar(features, candidates, mine, k):
+    """Return the k best (score, recipe_id) of candidates"""
+    return heapq.nlargest(
+        k,
+        ((jaccard(mine, features[other]), other) for other in candidates),
+    )
+
+
+def _atomic():
+    return transaction.atomic(using=router.db_for_write(RecipeSimilarity))
+
+
+def rebuild_user(user_id, k=SIMILAR_RECIPES):
+    """Recompute the whole index of a user's recipes"""
+    features = recipe_features(recipe__user_id=user_id)
+    index = defaultdict(set)
+    for recipe_id, mine in features.items():
+        for feature in mine:
+            index[feature].add(recipe_id)
+
+    rows = []
+    for recipe_id, mine in features.items():
+        candidates = set().union(*(index[feature] for feature in mine))
+        candidates.discard(recipe_id)
+        rows.extend(
+            RecipeSimilarity(
+                recipe_id=recipe_id,
+                similar_id=other,
+                score=score,
+            )
+            for score, other in top_similar(features, candidates, mine, k)
+        )
+    with _atomic():
+        RecipeSimilarity.objects.filter(recipe__user_id=user_id).delete()
+        RecipeSimilarity.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def update_recipe(recipe, k=SIMILAR_RECIPES):
+    """Refresh a recipe's neighbours after its tags or ingredients changed"""
+    mine = recipe_features(recipe_id=recipe.pk)[recipe.pk]
+    candidates = set()
+    for kind, through, column in FEATURES:
+        values = [value for feature, value in mine if feature == kind]
+        if values:
+            candidates.update(
+                through.objects.filter(**{f'{column}__in': values})
+                .values_list('recipe_id', flat=True)
+            )
+    candidates.discard(recipe.pk)
+    features = recipe_features(recipe_id__in=candidates)
+    scores = {other: jaccard(mine, features[other]) for other in candidates}
+
+    with _atomic():
+        RecipeSimilarity.objects.filter(recipe=recipe).delete()
+        RecipeSimilarity.objects.filter(similar=recipe).delete()
+        RecipeSimilarity.objects.bulk_create(
+            RecipeSimilarity(recipe=recipe, similar_id=other, score=score)
+            for score, other in top_similar(features, candidates, mine, k)
+        )
+
+        lists = defaultdict(list)
+        for row in RecipeSimilarity.objects.filter(
+            recipe_id__in=candidates,
+        ).values('id', 'recipe_id', 'score'):
+            lists[row['recipe_id']].append((row['score'], row['id']))
+        added, dropped = [], []
+        for other, score in scores.items():
+            current = lists[other]
+            if len(current) < k:
+                added.append((other, score))
+                continue
+            lowest = min(current)
+            if score > lowest[0]:
+                added.append((other, score))
+                dropped.append(lowest[1])
+        RecipeSimilarity.objects.filter(id__in=dropped).delete()
+        RecipeSimilarity.objects.bulk_create(
+            RecipeSimilarity(recipe_id=other, similar=recipe, score=score)
+            for other, score in added
+        )
+
+
+def _update_recipes(using, recipe_ids):
+    for recipe in Recipe.objects.using(using).filter(pk__in=recipe_ids):
+        update_recipe(recipe)
+
+
+def recipe_features_changed(sender, instance, action, reverse, pk_set,
+                            using, **kwargs):
+    """Refresh recipes whose tag or ingredient links changed, either side"""
+    if action == 'pre_clear':
+        if reverse:
+            column = THROUGH_COLUMNS[sender]
+            instance._similarity_cleared = list(
+                sender.objects.using(using)
+                .filter(**{column: instance.pk})
+                .values_list('recipe_id', flat=True)
+            )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        return
+    if not reverse:
+        update_recipe(instance)
+    elif action == 'post_clear':
+        _update_recipes(using, getattr(instance, '_similarity_cleared', ()))
+    else:
+        _update_recipes(using, pk_set)
+
+
+def feature_pre_delete(sender, instance, using, **kwargs):
+    """Remember the recipes of a tag/ingredient, its links go first"""
+    through, column = FEATURE_LINKS[sender._meta.model_name]
+    instance._similarity_recipes = list(
+        through.objects.using(using)
+        .filter(**{column: instance.pk})
+        .values_list('recipe_id', flat=True)
+    )
+
+
+def feature_deleted(sender, instance, using, **kwargs):
+    _update_recipes(using, getattr(instance, '_similarity_recipes', ()))
@@ -0,0 +1,227 @@
+"""
+Per-user dashboard stats, kept current from model signals.
+
+Counters move with F() updates so concurrent writes don't lose counts,
+tag usage is a JSON map updated under a row lock. Handlers skip users
+without a stats row; that row is built in full on first read (or by
+`rebuild_recipe_stats`), so it never holds partial totals. A build locks
+the row before reading the recipe data, so handlers that reach the row
+meanwhile wait and apply their change on top of the built totals. That
+needs the handler to run in the transaction of the write it counts (the
+API wraps its writes in one), else a build can count a committed write
+whose counter update is still to come.
+"""
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, Tag, UserRecipeStats
+
+TOP_TAGS = 5
+
+
+def top_tags(tag_usage, using=None):
+    """Return the most used tags of a usage map with their names"""
+    ranked = sorted(
+        ((count, int(tag_id)) for tag_id, count in tag_usage.items()),
+        key=lambda item: (-item[0], item[1]),
+    )[:TOP_TAGS]
+    names = dict(
+        Tag.objects.using(using)
+        .filter(id__in=[tag_id for _, tag_id in ranked])
+        .values_list('id', 'name')
+    )
+    return [
+        {'id': tag_id, 'name': names[tag_id], 'count': count}
+        for count, tag_id in ranked
+        if tag_id in names
+    ]
+
+
+def rebuild_user(user_id):
+    """Recompute a user's stats row from their recipe data"""
+    # Every read goes where the row is locked, a replica may lag behind it
+    using = router.db_for_write(UserRecipeStats)
+    with transaction.atomic(using=using):
+        UserRecipeStats.objects.using(using).get_or_create(user_id=user_id)
+        row = UserRecipeStats.objects.using(using).select_for_update().get(
+            user_id=user_id,
+        )
+        totals = Recipe.objects.using(using).filter(
+            user_id=user_id,
+        ).aggregate(
+            recipe_count=Count('id'),
+            total_price=Sum('price'),
+            total_time_minutes=Sum('time_minutes'),
+        )
+        usage = {
+            str(tag_id): count
+            for tag_id, count in Recipe.tag.through.objects.using(using)
+            .filter(recipe__user_id=user_id)
+            .values('tag_id')
+            .annotate(count=Count('id'))
+            .values_list('tag_id', 'count')
+        }
+        row.recipe_count = totals['recipe_count']
+        row.total_price = totals['total_price'] or 0
+        row.total_time_minutes = totals['total_time_minutes'] or 0
+        row.tag_count = Tag.objects.using(using).filter(
+            user_id=user_id,
+        ).count()
+        row.ingredient_count = Ingredient.objects.using(using).filter(
+            user_id=user_id,
+        ).count()
+        row.tag_usage = usage
+        row.top_tags = top_tags(usage, using)
+        row.save(using=using)
+    return row
+
+
+def for_user(user_id):
+    """Return the user's stats row, building it on first use"""
+    using = router.db_for_write(UserRecipeStats)
+    row = UserRecipeStats.objects.using(using).filter(user_id=user_id).first()
+    return row or rebuild_user(user_id)
+
+
+def _add(using, user_id, **deltas):
+    """Move the user's counters by deltas"""
+    UserRecipeStats.objects.using(using).filter(user_id=user_id).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + delta for field, delta in deltas.items()},
+    )
+
+
+def _tag_usage(using, user_id, deltas=None, drop=()):
+    """Apply {tag id: delta} to the usage map and refresh the top tags"""
+    with transaction.atomic(using=using):
+        row = UserRecipeStats.objects.using(using).select_for_update().filter(
+            user_id=user_id,
+        ).first()
+        if row is None:
+            return
+        usage = row.tag_usage
+        for tag_id, delta in (deltas or {}).items():
+            count = usage.get(str(tag_id), 0) + delta
+            if count > 0:
+                usage[str(tag_id)] = count
+            else:
+                usage.pop(str(tag_id), None)
+        for tag_id in drop:
+            usage.pop(str(tag_id), None)
+        row.top_tags = top_tags(usage, using)
+        row.save(update_fields=['tag_usage', 'top_tags', 'updated_at'])
+
+
+def recipe_pre_save(sender, instance, raw, using, update_fields, **kwargs):
+    """Remember the stored price and time of a recipe being updated"""
+    instance._stats_old = None
+    if raw or instance._state.adding:
+        return
+    if update_fields and not {'price', 'time_minutes'} & set(update_fields):
+        return
+    instance._stats_old = Recipe.objects.using(using).filter(
+        pk=instance.pk,
+    ).values_list('price', 'time_minutes').first()
+
+
+def recipe_saved(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    price = Decimal(str(instance.price))
+    if created:
+        _add(
+            using,
+            instance.user_id,
+            recipe_count=1,
+            total_price=price,
+            total_time_minutes=instance.time_minutes,
+        )
+        return
+    old = getattr(instance, '_stats_old', None)
+    if old and (price, instance.time_minutes) != old:
+        _add(
+            using,
+            instance.user_id,
+            total_price=price - old[0],
+            total_time_minutes=instance.time_minutes - old[1],
+        )
+
+
+def recipe_pre_delete(sender, instance, using, **kwargs):
+    """Remember the tags of a recipe, its links go before post_delete"""
+    instance._stats_tags = list(
+        Recipe.tag.through.objects.using(using)
+        .filter(recipe_id=instance.pk)
+        .values_list('tag_id', flat=True)
+    )
+
+
+def recipe_deleted(sender, instance, using, **kwargs):
+    _add(
+        using,
+        instance.user_id,
+        recipe_count=-1,
+        total_price=-Decimal(str(instance.price)),
+        total_time_minutes=-instance.time_minutes,
+    )
+    tags = getattr(instance, '_stats_tags', None)
+    if tags:
+        _tag_usage(using, instance.user_id, {tag_id: -1 for tag_id in tags})
+
+
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, using,
+                        **kwargs):
+    """Count tag links added or removed from either side"""
+    if action == 'pre_clear':
+        if reverse:
+            links = sender.objects.using(using).filter(tag_id=instance.pk)
+            instance._stats_cleared = list(
+                links.values_list('recipe_id', flat=True)
+            )
+        else:
+            links = sender.objects.using(using).filter(recipe_id=instance.pk)
+            instance._stats_cleared = list(
+                links.values_list('tag_id', flat=True)
+            )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        ids = getattr(instance, '_stats_cleared', None)
+    else:
+        ids = pk_set
+    if not ids:
+        return
+    sign = 1 if action == 'post_add' else -1
+    if reverse:
+        deltas = {instance.pk: sign * len(ids)}
+    else:
+        deltas = {tag_id: sign for tag_id in ids}
+    _tag_usage(using, instance.user_id, deltas)
+
+
+def tag_saved(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    if created:
+        _add(using, instance.user_id, tag_count=1)
+    else:
+        # a rename shows up in the top tags
+        _tag_usage(using, instance.user_id)
+
+
+def tag_deleted(sender, instance, using, **kwargs):
+    _add(using, instance.user_id, tag_count=-1)
+    _tag_usage(using, instance.user_id, drop=[instance.pk])
+
+
+def ingredient_saved(sender, instance, created, raw, using, **kwargs):
+    if created and not raw:
+        _add(using, instance.user_id, ingredient_count=1)
+
+
+def ingredient_deleted(sender, instance, using, **kwargs):
+    _add(using, instance.user_id, ingredient_count=-1)
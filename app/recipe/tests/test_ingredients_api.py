@@ -2,7 +2,11 @@
 Test for creating Ingredients
 """
 from decimal import Decimal
+import unittest
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.urls import reverse
 from django.test import TestCase
 
@@ -14,6 +18,7 @@ from core.models import (Ingredient,Recipe)
 from recipe.serializers import IngredientSerializer
 
 INGREDIENT_URL = reverse('recipe:ingredient-list')
+AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 def detail_url(ingredient_id):
     """Create and return an ingredient detail url"""
@@ -134,3 +139,62 @@ class PrivateIngredientApiTest(TestCase):
         res= self.client.get(INGREDIENT_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data),1)
+
+
+    def test_ingredients_recipe_count(self):
+        """Test assigned ingredients with their recipe counts"""
+        salt=Ingredient.objects.create(user=self.user,name='Salt')
+        Ingredient.objects.create(user=self.user,name='Saffron')
+        for title in ('Chips','Soup'):
+            recipe=Recipe.objects.create(
+                user=self.user,
+                title=title,
+                price=Decimal('1.00'),
+                time_minutes=5,
+            )
+            recipe.ingredients.add(salt)
+
+        res=self.client.get(
+            INGREDIENT_URL,
+            {'assigned_only':1,'recipe_count':1},
+        )
+
+        self.assertEqual(
+            res.data,
+            [{'id':salt.id,'name':'Salt','recipe_count':2}],
+        )
+
+
+class IngredientAutocompleteApiTest(TestCase):
+    """Test the ingredient autocomplete endpoint"""
+
+    def setUp(self):
+        self.user=create_user()
+        self.client=APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_autocomplete_prefix(self):
+        """Test ingredients starting with the prefix are returned"""
+        Ingredient.objects.create(user=self.user,name='Garlic')
+        Ingredient.objects.create(user=self.user,name='Ginger')
+
+        res = self.client.get(AUTOCOMPLETE_URL,{'q':'gar'})
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual([ing['name'] for ing in res.data],['Garlic'])
+
+    @unittest.skipUnless(
+        connection.vendor == 'postgresql',
+        'Trigram matching needs PostgreSQL',
+    )
+    def test_autocomplete_tolerates_typos(self):
+        """Test a misspelt name still matches, after prefix matches"""
+        Ingredient.objects.create(user=self.user,name='Chicken')
+        Ingredient.objects.create(user=self.user,name='Chickpeas')
+
+        res = self.client.get(AUTOCOMPLETE_URL,{'q':'chiken'})
+
+        self.assertEqual(res.data[0]['name'],'Chicken')
@@ -0,0 +1,288 @@
+"""
+Query plan regression tests for the hot recipe querysets.
+
+A realistic dataset is seeded and analyzed, then the querysets built by
+RecipeViewSet and the tag/ingredient viewsets are EXPLAINed. The tests fail
+when the planner starts scanning a whole hot table or sorting more rows
+than one user owns, which is how a dropped index or a changed query
+usually shows up.
+"""
+import hashlib
+import json
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe import views
+
+USERS = 100
+RECIPES_PER_USER = 150
+TAGS_PER_USER = 15
+INGREDIENTS_PER_USER = 40
+ATTRS_PER_RECIPE = 3
+
+# Seq scans of tables (or partitions) smaller than this are fine
+SEQ_SCAN_MIN_ROWS = 500
+
+HOT_TABLES = (
+    'core_recipe',
+    'core_recipe_tag',
+    'core_recipe_ingredients',
+    'core_tag',
+    'core_ingredient',
+)
+
+
+def seed():
+    """Create USERS users with recipes, tags and ingredients"""
+    users = get_user_model().objects.bulk_create(
+        get_user_model()(email=f'user{n}@example.com', password='x')
+        for n in range(USERS)
+    )
+    for user in users:
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'tag {n}') for n in range(TAGS_PER_USER)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'ingredient {n}')
+            for n in range(INGREDIENTS_PER_USER)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                user=user,
+                title=f'recipe {n}',
+                description='x' * 200,
+                time_minutes=n % 120,
+                price=Decimal(n % 50),
+            )
+            for n in range(RECIPES_PER_USER)
+        )
+        Recipe.tag.through.objects.bulk_create(
+            Recipe.tag.through(
+                recipe=recipe,
+                tag=tags[(n + k) % TAGS_PER_USER],
+            )
+            for n, recipe in enumerate(recipes)
+            for k in range(ATTRS_PER_RECIPE)
+        )
+        Recipe.ingredients.through.objects.bulk_create(
+            Recipe.ingredients.through(
+                recipe=recipe,
+                ingredient=ingredients[(n * 7 + k) % INGREDIENTS_PER_USER],
+            )
+            for n, recipe in enumerate(recipes)
+            for k in range(ATTRS_PER_RECIPE)
+        )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return users
+
+
+def seed_names(model, user, count=5000):
+    """Give user count distinct names of model, return them"""
+    names = [
+        hashlib.md5(str(n).encode()).hexdigest()[:12] for n in range(count)
+    ]
+    model.objects.bulk_create(model(user=user, name=name) for name in names)
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE {model._meta.db_table}')
+    return names
+
+
+def plan_nodes(plan):
+    """Yield every node of a JSON EXPLAIN plan"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def table_rows():
+    """Return the planner's row estimate for every table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"
+        )
+        return dict(cursor.fetchall())
+
+
+def explain(queryset):
+    """Return the flattened plan nodes of queryset"""
+    output = queryset.explain(format='json')
+    return list(plan_nodes(json.loads(output)[0]['Plan']))
+
+
+def viewset_queryset(viewset_class, user, action='list', **params):
+    """Build the queryset a viewset would use for a request"""
+    request = Request(APIRequestFactory().get('/', params))
+    request.user = user
+    view = viewset_class()
+    view.request = request
+    view.action = action
+    view.format_kwarg = None
+    return view.get_queryset()
+
+
+@unittest.skipUnless(
+    connection.vendor == 'postgresql',
+    'plan tests need PostgreSQL',
+)
+class QueryPlanTests(TestCase):
+    """Test hot querysets keep index-backed plans."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed()[USERS // 2]
+
+    def assertGoodPlan(self, queryset):
+        """Fail on full scans of hot tables and sorts of a full table"""
+        rows = table_rows()
+        for node in explain(queryset):
+            relation = node.get('Relation Name', '')
+            hot = relation.startswith(HOT_TABLES)
+            if (node['Node Type'] == 'Seq Scan' and hot
+                    and rows.get(relation, 0) > SEQ_SCAN_MIN_ROWS):
+                self.fail(f'Seq Scan on {relation}:\n{queryset.query}')
+            if node['Node Type'] == 'Sort':
+                self.assertLessEqual(
+                    node['Plan Rows'],
+                    RECIPES_PER_USER * ATTRS_PER_RECIPE,
+                    f'Sort of {node["Plan Rows"]} rows:\n{queryset.query}',
+                )
+
+    def test_recipe_list(self):
+        """Test the recipe list uses the user index"""
+        self.assertGoodPlan(viewset_queryset(views.RecipeViewSet, self.user))
+
+    def test_recipe_list_tag_filter(self):
+        """Test filtering recipes by tags"""
+        tags = Tag.objects.filter(user=self.user)[:2]
+        queryset = viewset_queryset(
+            views.RecipeViewSet,
+            self.user,
+            tag=','.join(str(tag.id) for tag in tags),
+        )
+
+        self.assertGoodPlan(queryset)
+
+    def test_recipe_list_ingredient_filter(self):
+        """Test filtering recipes by ingredients"""
+        ingredients = Ingredient.objects.filter(user=self.user)[:2]
+        queryset = viewset_queryset(
+            views.RecipeViewSet,
+            self.user,
+            ingredients=','.join(str(i.id) for i in ingredients),
+        )
+
+        self.assertGoodPlan(queryset)
+
+    def test_recipe_list_price_range_ordering(self):
+        """Test price filters and ordering use the (user, price) index"""
+        queryset = viewset_queryset(
+            views.RecipeViewSet,
+            self.user,
+            min_price='10',
+            max_price='20',
+            ordering='-price',
+        )
+
+        self.assertGoodPlan(queryset)
+
+    def test_recipe_list_time_ordering(self):
+        """Test ordering by cooking time"""
+        queryset = viewset_queryset(
+            views.RecipeViewSet,
+            self.user,
+            max_time_minutes=30,
+            ordering='time_minutes',
+        )
+
+        self.assertGoodPlan(queryset)
+
+    def test_tag_list(self):
+        """Test listing tags"""
+        self.assertGoodPlan(viewset_queryset(views.TagViewSet, self.user))
+
+    def test_tags_assigned_only(self):
+        """Test listing tags assigned to recipes"""
+        queryset = viewset_queryset(
+            views.TagViewSet,
+            self.user,
+            assigned_only=1,
+        )
+
+        self.assertGoodPlan(queryset)
+
+    def test_ingredients_assigned_only(self):
+        """Test listing ingredients assigned to recipes"""
+        queryset = viewset_queryset(
+            views.IngrediantViewSet,
+            self.user,
+            assigned_only=1,
+        )
+
+        self.assertGoodPlan(queryset)
+
+    def test_tags_by_popularity(self):
+        """Test sorting tags by their recipe counts"""
+        queryset = viewset_queryset(
+            views.TagViewSet,
+            self.user,
+            ordering='-recipe_count',
+        )
+
+        self.assertGoodPlan(queryset)
+
+    def assertUsesIndex(self, queryset, *index_names):
+        """Fail unless the plan reads one of index_names"""
+        used = {node.get('Index Name') for node in explain(queryset)}
+        self.assertTrue(
+            used & set(index_names),
+            f'None of {index_names} in {used}:\n{queryset.query}',
+        )
+
+    def test_autocomplete_prefix(self):
+        """Test prefix matches use the (user, UPPER(name)) index"""
+        names = seed_names(Tag, self.user)
+        view = views.TagViewSet()
+        queryset = view._prefix_matches(
+            Tag.objects.filter(user=self.user),
+            names[0][:4],
+        )
+
+        self.assertGoodPlan(queryset)
+        self.assertUsesIndex(queryset, 'tag_user_name_upper_idx')
+
+    def test_autocomplete_similar(self):
+        """Test trigram matches use the (user, name) trigram index"""
+        names = seed_names(Ingredient, self.user)
+        view = views.IngrediantViewSet()
+        queryset = view._similar_matches(
+            Ingredient.objects.filter(user=self.user),
+            names[0][:10] + 'zz',
+        )
+
+        self.assertGoodPlan(queryset)
+        self.assertUsesIndex(queryset, 'ingredient_user_name_trgm_idx')
+
+    def test_cookable_ranking(self):
+        """Test ranking recipes by ingredients on hand"""
+        view = views.RecipeViewSet()
+        view.request = Request(APIRequestFactory().get('/'))
+        view.request.user = self.user
+        ingredient_ids = list(
+            Ingredient.objects.filter(user=self.user)
+            .values_list('id', flat=True)[:5]
+        )
+
+        self.assertGoodPlan(view._cookable(ingredient_ids))
@@ -4,12 +4,16 @@ Test for recipe APIs
 
 from decimal import Decimal
 import tempfile
+import unittest
 import os
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -26,6 +30,11 @@ from recipe.serializers import (
 )
 
 RECIPES_URL = reverse('recipe:recipe-list') 
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL"""
+    return reverse('recipe:recipe-similar',args=[recipe_id])
 
 def detail_url(recipe_id):
     """Create and return a recipe URL"""
@@ -74,6 +83,9 @@ class PrivateRecipeAPITest(TestCase):
         self.user=create_user(email='user@example.com',password='test123')
         self.client.force_authenticate(self.user)
 
+    def tearDown(self):
+        cache.clear()
+
     def test_retrive_recipes(self):
         """Test retrieve a list of recipes"""
         create_recipe(user=self.user)
@@ -420,7 +432,305 @@ class PrivateRecipeAPITest(TestCase):
         self.assertIn(s2.data,res.data)
         self.assertNotIn(s3.data,res.data)
 
+    def test_list_sparse_fields(self):
+        """Test ?fields= limits the returned recipe fields."""
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL,{'fields':'title,price'})
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(set(res.data[0]),{'id','title','price'})
+
+    def test_detail_exclude_fields(self):
+        """Test ?exclude= drops fields from recipe detail."""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(
+            detail_url(recipe.id),
+            {'exclude':'description,tag,ingredients'},
+        )
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertNotIn('description',res.data)
+        self.assertNotIn('tag',res.data)
+        self.assertEqual(res.data['title'],recipe.title)
+
+    def test_sparse_fields_skip_prefetch(self):
+        """Test unrequested relations are not queried."""
+        recipe = create_recipe(user=self.user)
+        recipe.tag.add(Tag.objects.create(user=self.user,name='Vegan'))
+
+        # warm the cached shard placement, only the recipe query is left
+        self.client.get(RECIPES_URL)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL,{'fields':'title'})
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(len(queries),1)
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('core_tag',sql)
+        self.assertNotIn('description',sql)
+
+    def test_search_recipes(self):
+        """Test ?search= matches title and description."""
+        r1 = create_recipe(user=self.user,title='Thai green curry')
+        r2 = create_recipe(
+            user=self.user,
+            title='Weeknight noodles',
+            description='A quick curry broth',
+        )
+        create_recipe(user=self.user,title='Pancakes')
+        other = create_user(email='other@example.com',password='test123')
+        create_recipe(user=other,title='Curry laksa')
+
+        res = self.client.get(RECIPES_URL,{'search':'curry'})
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual({item['id'] for item in res.data},{r1.id,r2.id})
+        self.assertIn('rank',res.data[0])
+        self.assertIn('title_headline',res.data[0])
+        self.assertIn('headline',res.data[0])
+
+    @unittest.skipUnless(
+        connection.vendor == 'postgresql',
+        'Full text search needs PostgreSQL',
+    )
+    def test_search_ranks_title_matches_first(self):
+        """Test title matches rank above description matches."""
+        in_description = create_recipe(
+            user=self.user,
+            title='Weeknight noodles',
+            description='Finish with curry paste',
+        )
+        in_title = create_recipe(user=self.user,title='Curry noodles')
+
+        res = self.client.get(RECIPES_URL,{'search':'curry'})
+
+        self.assertEqual(
+            [item['id'] for item in res.data],
+            [in_title.id,in_description.id],
+        )
+        self.assertIn('<b>Curry</b>',res.data[0]['title_headline'])
+        self.assertIn('<b>curry</b>',res.data[1]['headline'])
+
+
+
+    def test_cookable_ranking(self):
+        """Test recipes are ranked by ingredients on hand."""
+        egg = Ingredient.objects.create(user=self.user,name='Egg')
+        flour = Ingredient.objects.create(user=self.user,name='Flour')
+        milk = Ingredient.objects.create(user=self.user,name='Milk')
+        beef = Ingredient.objects.create(user=self.user,name='Beef')
+        omelette = create_recipe(user=self.user,title='Omelette')
+        omelette.ingredients.add(egg)
+        pancakes = create_recipe(user=self.user,title='Pancakes')
+        pancakes.ingredients.add(egg,flour,milk)
+        burger = create_recipe(user=self.user,title='Burger')
+        burger.ingredients.add(beef)
+
+        res = self.client.get(
+            COOKABLE_URL,
+            {'have':f'{egg.id},{flour.id}'},
+        )
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in res.data],
+            [omelette.id,pancakes.id],
+        )
+        self.assertEqual(res.data[0]['missing'],[])
+        self.assertEqual(res.data[1]['covered'],2)
+        self.assertEqual(
+            [ing['name'] for ing in res.data[1]['missing']],
+            ['Milk'],
+        )
+
+    def test_cookable_limited_to_user(self):
+        """Test other users' recipes are not ranked."""
+        other = create_user(email='other@example.com',password='test123')
+        salt = Ingredient.objects.create(user=other,name='Salt')
+        create_recipe(user=other).ingredients.add(salt)
+
+        res = self.client.get(COOKABLE_URL,{'have':str(salt.id)})
+
+        self.assertEqual(res.data,[])
+
+    def test_cookable_invalid_ids(self):
+        """Test ?have= values that are not ids are a 400"""
+        for have in ('abc','1,x','0','99999999999999999999'):
+            res = self.client.get(COOKABLE_URL,{'have':have})
+
+            self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
+            self.assertIn('have',res.data)
+
+    def test_similar_recipes(self):
+        """Test similar recipes follow tag and ingredient writes."""
+        payload = {
+            'title':'Green curry',
+            'time_minutes':30,
+            'price':Decimal('6.00'),
+            'tag':[{'name':'Thai'}],
+            'ingredients':[{'name':'Coconut milk'}],
+        }
+        first = self.client.post(RECIPES_URL,payload,format='json')
+        payload['title'] = 'Red curry'
+        second = self.client.post(RECIPES_URL,payload,format='json')
+        payload['title'] = 'Pancakes'
+        payload['tag'] = [{'name':'Breakfast'}]
+        payload['ingredients'] = []
+        self.client.post(RECIPES_URL,payload,format='json')
+
+        res = self.client.get(similar_url(first.data['id']))
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data],[second.data['id']])
+        self.assertEqual(res.data[0]['score'],1.0)
+
+    def test_similar_other_user_recipe(self):
+        """Test similar recipes of another user's recipe are not found."""
+        other = create_user(email='other@example.com',password='test123')
+        recipe = create_recipe(user=other)
 
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code,status.HTTP_404_NOT_FOUND)
+
+    def test_list_facets(self):
+        """Test facet counts cover the filtered recipes."""
+        thai = Tag.objects.create(user=self.user,name='Thai')
+        quick = Tag.objects.create(user=self.user,name='Quick')
+        rice = Ingredient.objects.create(user=self.user,name='Rice')
+        r1 = create_recipe(user=self.user,title='Green curry')
+        r1.tag.add(thai,quick)
+        r1.ingredients.add(rice)
+        r2 = create_recipe(user=self.user,title='Pad thai')
+        r2.tag.add(thai)
+        r3 = create_recipe(user=self.user,title='Toast')
+        r3.tag.add(quick)
+
+        res = self.client.get(RECIPES_URL,{'tag':thai.id,'facets':1})
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']),2)
+        self.assertEqual(
+            res.data['facets']['tag'],
+            [
+                {'id':thai.id,'name':'Thai','count':2},
+                {'id':quick.id,'name':'Quick','count':1},
+            ],
+        )
+        self.assertEqual(
+            res.data['facets']['ingredients'],
+            [{'id':rice.id,'name':'Rice','count':1}],
+        )
+
+    def test_list_facets_invalidated(self):
+        """Test cached facet counts follow recipe changes."""
+        thai = Tag.objects.create(user=self.user,name='Thai')
+        recipe = create_recipe(user=self.user)
+        recipe.tag.add(thai)
+        self.client.get(RECIPES_URL,{'facets':1})
+
+        create_recipe(user=self.user).tag.add(thai)
+        res = self.client.get(RECIPES_URL,{'facets':1})
+
+        self.assertEqual(res.data['facets']['tag'][0]['count'],2)
+
+    def test_list_facets_follow_tag_rename(self):
+        """Test cached facets show a renamed tag."""
+        thai = Tag.objects.create(user=self.user,name='Thai')
+        create_recipe(user=self.user).tag.add(thai)
+        self.client.get(RECIPES_URL,{'facets':'true'})
+
+        thai.name = 'Thai food'
+        thai.save()
+        res = self.client.get(RECIPES_URL,{'facets':'true'})
+
+        self.assertEqual(res.data['facets']['tag'][0]['name'],'Thai food')
+
+    def test_list_facets_invalid(self):
+        """Test a facets value that isn't a boolean is a 400."""
+        res = self.client.get(RECIPES_URL,{'facets':'maybe'})
+
+        self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
+        self.assertIn('facets',res.data)
+
+    def test_list_without_facets(self):
+        """Test the list stays a plain array by default."""
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIsInstance(res.data,list)
+
+    def test_range_filters(self):
+        """Test filtering by cooking time and price range."""
+        quick_cheap = create_recipe(
+            user=self.user,time_minutes=10,price=Decimal('3.00'),
+        )
+        create_recipe(user=self.user,time_minutes=60,price=Decimal('3.00'))
+        create_recipe(user=self.user,time_minutes=10,price=Decimal('9.00'))
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'max_time_minutes':15,'min_price':'2.50','max_price':'5'},
+        )
+
+        self.assertEqual([item['id'] for item in res.data],[quick_cheap.id])
+
+    def test_range_filter_invalid(self):
+        """Test a non numeric range is rejected."""
+        res = self.client.get(RECIPES_URL,{'max_price':'cheap'})
+
+        self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
+
+    def test_range_filter_not_finite(self):
+        """Test NaN and Infinity prices are rejected."""
+        for value in ('NaN','Infinity','-inf'):
+            res = self.client.get(RECIPES_URL,{'min_price':value})
+
+            self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
+            self.assertIn('min_price',res.data)
+
+    def test_ordering(self):
+        """Test sorting the list by a whitelisted field."""
+        r1 = create_recipe(user=self.user,price=Decimal('8.00'))
+        r2 = create_recipe(user=self.user,price=Decimal('2.00'))
+        r3 = create_recipe(user=self.user,price=Decimal('8.00'))
+
+        res = self.client.get(RECIPES_URL,{'ordering':'-price'})
+
+        self.assertEqual(
+            [item['id'] for item in res.data],
+            [r3.id,r1.id,r2.id],
+        )
+
+    def test_ordering_not_whitelisted(self):
+        """Test sorting by an unindexed field is refused."""
+        res = self.client.get(RECIPES_URL,{'ordering':'description'})
+
+        self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
+
+    def test_keyset_pages(self):
+        """Test ?page_size= walks the ordered list with cursors."""
+        recipes = [
+            create_recipe(user=self.user,time_minutes=minutes)
+            for minutes in (30,10,20,10)
+        ]
+
+        first = self.client.get(
+            RECIPES_URL,
+            {'ordering':'time_minutes','page_size':3,'fields':'title'},
+        )
+        second = self.client.get(first.data['next'])
+
+        expected = sorted(recipes,key=lambda r:(r.time_minutes,r.id))
+        pages = first.data['results']+second.data['results']
+        self.assertEqual(
+            [item['id'] for item in pages],
+            [recipe.id for recipe in expected],
+        )
+        self.assertIsNone(second.data['next'])
 
 
 class IMageUploadTest(TestCase):
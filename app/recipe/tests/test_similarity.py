@@ -0,0 +1,162 @@
+"""
+Tests for the similar-recipe index.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from core.models import (
+    Recipe,
+    RecipeSimilarity,
+    Tag,
+    Ingredient,
+)
+from recipe import similarity
+
+
+def create_recipe(user, title, tags=(), ingredients=()):
+    """Create a recipe with the given tags and ingredients"""
+    recipe = Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=Decimal('1.00'),
+    )
+    recipe.tag.add(*tags)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+def neighbours(recipe):
+    """Return the indexed similar recipe ids, best first"""
+    return list(
+        RecipeSimilarity.objects.filter(recipe=recipe)
+        .order_by('-score', '-similar_id')
+        .values_list('similar_id', flat=True)
+    )
+
+
+class JaccardTests(SimpleTestCase):
+    """Test the similarity score."""
+
+    def test_jaccard(self):
+        """Test shared over combined features"""
+        a = {('tag', 1), ('ingredient', 1)}
+        b = {('tag', 1), ('ingredient', 2)}
+
+        self.assertAlmostEqual(similarity.jaccard(a, b), 1 / 3)
+        self.assertEqual(similarity.jaccard(a, {('tag', 2)}), 0.0)
+
+
+class SimilarityIndexTests(TestCase):
+    """Test building and maintaining the index."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+        self.tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+
+    def test_rebuild_user(self):
+        """Test neighbours are ranked by overlap"""
+        bowl = create_recipe(
+            self.user,
+            'Bowl',
+            [self.vegan, self.quick],
+            [self.rice, self.tofu],
+        )
+        stir_fry = create_recipe(
+            self.user, 'Stir fry', [self.vegan], [self.rice, self.tofu],
+        )
+        pilaf = create_recipe(self.user, 'Pilaf', [], [self.rice])
+        create_recipe(self.user, 'Toast')
+
+        similarity.rebuild_user(self.user.id)
+
+        self.assertEqual(neighbours(bowl), [stir_fry.id, pilaf.id])
+        self.assertEqual(neighbours(pilaf), [stir_fry.id, bowl.id])
+
+    def test_rebuild_keeps_top_k(self):
+        """Test only k neighbours are stored"""
+        recipes = [
+            create_recipe(self.user, f'Recipe {n}', [self.vegan])
+            for n in range(4)
+        ]
+
+        similarity.rebuild_user(self.user.id, k=2)
+
+        self.assertEqual(len(neighbours(recipes[0])), 2)
+
+    def test_update_recipe(self):
+        """Test a changed recipe joins its neighbours' lists"""
+        bowl = create_recipe(self.user, 'Bowl', [self.vegan], [self.rice])
+        pilaf = create_recipe(self.user, 'Pilaf', [], [self.tofu])
+        similarity.rebuild_user(self.user.id)
+        self.assertEqual(neighbours(bowl), [])
+
+        pilaf.ingredients.add(self.rice)
+
+        self.assertEqual(neighbours(bowl), [pilaf.id])
+        self.assertEqual(neighbours(pilaf), [bowl.id])
+
+    def test_links_changed_from_tag_side(self):
+        """Test links added and cleared through a tag refresh its recipes"""
+        bowl = create_recipe(self.user, 'Bowl', [self.vegan])
+        pilaf = create_recipe(self.user, 'Pilaf')
+
+        self.vegan.recipe_set.add(pilaf)
+        self.assertEqual(neighbours(bowl), [pilaf.id])
+
+        self.vegan.recipe_set.clear()
+        self.assertEqual(neighbours(bowl), [])
+        self.assertEqual(neighbours(pilaf), [])
+
+    def test_deleted_tag_leaves_index(self):
+        """Test deleting a shared tag drops the recipes' similarity"""
+        bowl = create_recipe(self.user, 'Bowl', [self.vegan])
+        pilaf = create_recipe(self.user, 'Pilaf', [self.vegan])
+        self.assertEqual(neighbours(bowl), [pilaf.id])
+
+        self.vegan.delete()
+
+        self.assertEqual(neighbours(bowl), [])
+        self.assertEqual(neighbours(pilaf), [])
+
+    def test_update_recipe_replaces_weakest(self):
+        """Test a closer recipe pushes out the weakest neighbour"""
+        bowl = create_recipe(self.user, 'Bowl', [self.vegan], [self.rice])
+        weak = create_recipe(self.user, 'Salad', [self.vegan], [self.tofu])
+        close = create_recipe(self.user, 'Curry', [self.quick], [])
+        similarity.rebuild_user(self.user.id, k=1)
+
+        close.tag.set([self.vegan])
+        close.ingredients.set([self.rice])
+        similarity.update_recipe(close, k=1)
+
+        self.assertEqual(neighbours(bowl), [close.id])
+        self.assertNotIn(weak.id, neighbours(bowl))
+
+    def test_deleted_recipe_leaves_index(self):
+        """Test deleting a recipe removes its rows"""
+        bowl = create_recipe(self.user, 'Bowl', [self.vegan])
+        pilaf = create_recipe(self.user, 'Pilaf', [self.vegan])
+        similarity.rebuild_user(self.user.id)
+
+        pilaf.delete()
+
+        self.assertEqual(neighbours(bowl), [])
+
+    def test_build_similarity_command(self):
+        """Test the batch command rebuilds every user"""
+        bowl = create_recipe(self.user, 'Bowl', [self.vegan])
+        pilaf = create_recipe(self.user, 'Pilaf', [self.vegan])
+
+        call_command('build_similarity')
+
+        self.assertEqual(neighbours(bowl), [pilaf.id])
@@ -0,0 +1,244 @@
+"""
+Tests for the per-user recipe stats.
+"""
+import threading
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+    UserRecipeStats,
+)
+from recipe import stats
+
+STATS_URL = reverse('recipe:stats')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+STAT_FIELDS = (
+    'recipe_count',
+    'total_price',
+    'total_time_minutes',
+    'tag_count',
+    'ingredient_count',
+    'tag_usage',
+    'top_tags',
+)
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeStatsApiTests(TestCase):
+    """Test the stats endpoint and its incremental upkeep."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertMatchesRebuild(self):
+        """Fail if the incremental row differs from a full rebuild"""
+        row = UserRecipeStats.objects.get(user=self.user)
+        rebuilt = stats.rebuild_user(self.user.id)
+        for field in STAT_FIELDS:
+            self.assertEqual(
+                getattr(row, field),
+                getattr(rebuilt, field),
+                field,
+            )
+
+    def test_auth_required(self):
+        """Test the stats need authentication"""
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stats_built_on_first_read(self):
+        """Test existing recipes are counted on the first request"""
+        create_recipe(self.user, price=Decimal('4.00'), time_minutes=10)
+        create_recipe(self.user, price=Decimal('6.50'), time_minutes=25)
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='test123',
+        )
+        create_recipe(other)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_price'], '5.25')
+        self.assertEqual(res.data['average_time_minutes'], 17.5)
+
+    def test_stats_empty(self):
+        """Test a user without recipes has no averages"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['average_price'])
+
+    def test_stats_follow_api_writes(self):
+        """Test recipe, tag and ingredient writes keep the row current"""
+        self.client.get(STATS_URL)
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': Decimal('7.00'),
+            'tag': [{'name': 'Thai'}, {'name': 'Dinner'}],
+            'ingredients': [{'name': 'Rice'}],
+        }
+        curry = self.client.post(RECIPES_URL, payload, format='json')
+        payload.update(title='Soup', tag=[{'name': 'Thai'}])
+        soup = self.client.post(RECIPES_URL, payload, format='json')
+        self.client.patch(
+            reverse('recipe:recipe-detail', args=[curry.data['id']]),
+            {'price': Decimal('9.00'), 'tag': []},
+            format='json',
+        )
+        self.client.delete(
+            reverse('recipe:recipe-detail', args=[soup.data['id']]),
+        )
+        Tag.objects.get(user=self.user, name='Dinner').delete()
+        Ingredient.objects.create(user=self.user, name='Lime')
+        self.assertMatchesRebuild()
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(res.data['average_price'], '9.00')
+        self.assertEqual(res.data['tag_count'], 1)
+        self.assertEqual(res.data['ingredient_count'], 2)
+        self.assertEqual(res.data['top_tags'], [])
+
+    def test_top_tags(self):
+        """Test the most used tags are listed with counts"""
+        self.client.get(STATS_URL)
+        thai = Tag.objects.create(user=self.user, name='Thai')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        create_recipe(self.user).tag.add(thai, quick)
+        create_recipe(self.user).tag.add(thai)
+        quick.name = 'Fast'
+        quick.save()
+        self.assertMatchesRebuild()
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(
+            res.data['top_tags'],
+            [
+                {'id': thai.id, 'name': 'Thai', 'count': 2},
+                {'id': quick.id, 'name': 'Fast', 'count': 1},
+            ],
+        )
+
+    def test_rebuild_command(self):
+        """Test the command recomputes a drifted row"""
+        create_recipe(self.user)
+        self.client.get(STATS_URL)
+        UserRecipeStats.objects.filter(user=self.user).update(recipe_count=9)
+
+        call_command('rebuild_recipe_stats')
+
+        self.assertEqual(
+            UserRecipeStats.objects.get(user=self.user).recipe_count,
+            1,
+        )
+
+
+@unittest.skipUnless(
+    connection.vendor == 'postgresql',
+    'row locks are PostgreSQL only',
+)
+class RecipeStatsRaceTests(TransactionTestCase):
+    """Test writes during a build are counted once."""
+
+    def test_write_during_build_counted(self):
+        """Test a recipe added while the row is built ends up counted"""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        create_recipe(user)
+
+        def write():
+            try:
+                create_recipe(user)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=write)
+        real_top_tags = stats.top_tags
+
+        def top_tags_then_write(*args, **kwargs):
+            # the recipe commits after the build read its totals
+            writer.start()
+            time.sleep(0.5)
+            return real_top_tags(*args, **kwargs)
+
+        with patch('recipe.stats.top_tags', side_effect=top_tags_then_write):
+            stats.for_user(user.id)
+        writer.join()
+
+        row = UserRecipeStats.objects.get(user=user)
+        self.assertEqual(row.recipe_count, 2)
+
+    def test_build_during_api_write_not_counted_twice(self):
+        """Test a build between a recipe insert and its count update"""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        create_recipe(user)
+        stats.for_user(user.id)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        def build():
+            try:
+                stats.rebuild_user(user.id)
+            finally:
+                connection.close()
+
+        builder = threading.Thread(target=build)
+        real_add = stats._add
+
+        def build_then_add(*args, **kwargs):
+            # the recipe row exists but its counter update is pending
+            builder.start()
+            time.sleep(0.5)
+            return real_add(*args, **kwargs)
+
+        with patch('recipe.stats._add', side_effect=build_then_add):
+            client.post(RECIPES_URL, {
+                'title': 'Soup',
+                'time_minutes': 10,
+                'price': Decimal('2.00'),
+            })
+        builder.join()
+
+        row = UserRecipeStats.objects.get(user=user)
+        self.assertEqual(row.recipe_count, 2)
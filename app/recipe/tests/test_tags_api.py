@@ -5,6 +5,7 @@ Test for  tag API.
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from django.test import TestCase
 
@@ -17,6 +18,7 @@ from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 def detail_url(tag_id):
     """Create and return tag detail url."""
@@ -139,3 +141,119 @@ class PrivateTagsApiTest(TestCase):
         res = self.client.get(TAGS_URL,{'assigned_only': 1})
 
         self.assertEqual(len(res.data),1)
+
+
+    def _recipe_with_tags(self,*tags):
+        recipe=Recipe.objects.create(
+            user=self.user,
+            title='Sample',
+            price=Decimal('1.00'),
+            time_minutes=5,
+        )
+        recipe.tag.add(*tags)
+        return recipe
+
+    def test_tags_recipe_count(self):
+        """Test tags can include how many recipes use them"""
+        snacks=Tag.objects.create(user=self.user,name='Snacks')
+        fried=Tag.objects.create(user=self.user,name='Fried')
+        self._recipe_with_tags(snacks,fried)
+        self._recipe_with_tags(snacks)
+
+        res=self.client.get(TAGS_URL,{'recipe_count':1})
+
+        counts={tag['name']:tag['recipe_count'] for tag in res.data}
+        self.assertEqual(counts,{'Snacks':2,'Fried':1})
+
+    def test_tags_sorted_by_popularity(self):
+        """Test ordering tags by recipe count"""
+        rare=Tag.objects.create(user=self.user,name='Apple')
+        popular=Tag.objects.create(user=self.user,name='Zest')
+        unused=Tag.objects.create(user=self.user,name='Mint')
+        self._recipe_with_tags(rare,popular)
+        self._recipe_with_tags(popular)
+
+        res=self.client.get(TAGS_URL,{'ordering':'-recipe_count'})
+
+        self.assertEqual(
+            [tag['id'] for tag in res.data],
+            [popular.id,rare.id,unused.id],
+        )
+        self.assertEqual(res.data[2]['recipe_count'],0)
+
+    def test_tags_invalid_params(self):
+        """Test unknown ordering and non boolean flags are a 400"""
+        for params in (
+            {'ordering':'bogus'},
+            {'recipe_count':'lots'},
+            {'assigned_only':'2'},
+        ):
+            res=self.client.get(TAGS_URL,params)
+
+            self.assertEqual(res.status_code,status.HTTP_400_BAD_REQUEST)
+            self.assertIn(next(iter(params)),res.data)
+
+    def test_tags_paginated(self):
+        """Test ?limit= pages through tags"""
+        for name in ('A','B','C'):
+            Tag.objects.create(user=self.user,name=name)
+
+        res=self.client.get(TAGS_URL,{'limit':2,'offset':2})
+
+        self.assertEqual(res.data['count'],3)
+        self.assertEqual([tag['name'] for tag in res.data['results']],['A'])
+
+
+class TagAutocompleteApiTest(TestCase):
+    """Test the tag autocomplete endpoint"""
+
+    def setUp(self):
+        self.user=create_user()
+        self.client=APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_autocomplete_prefix(self):
+        """Test names starting with the prefix are returned"""
+        Tag.objects.create(user=self.user,name='Vegan')
+        Tag.objects.create(user=self.user,name='Vegetarian')
+        Tag.objects.create(user=self.user,name='Dessert')
+        other = create_user(email='other@example.com')
+        Tag.objects.create(user=other,name='Vegemite')
+
+        res = self.client.get(AUTOCOMPLETE_URL,{'q':'VEG'})
+
+        self.assertEqual(res.status_code,status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['Vegan','Vegetarian'],
+        )
+
+    def test_autocomplete_limit(self):
+        """Test only the top limit matches are returned"""
+        for name in ('Spicy','Spring','Sprouts'):
+            Tag.objects.create(user=self.user,name=name)
+
+        res = self.client.get(AUTOCOMPLETE_URL,{'q':'sp','limit':2})
+
+        self.assertEqual(len(res.data),2)
+
+    def test_autocomplete_empty_prefix(self):
+        """Test an empty prefix returns nothing"""
+        Tag.objects.create(user=self.user,name='Vegan')
+
+        res = self.client.get(AUTOCOMPLETE_URL)
+
+        self.assertEqual(res.data,[])
+
+    def test_autocomplete_cache_invalidated(self):
+        """Test a new tag shows up in a cached prefix"""
+        Tag.objects.create(user=self.user,name='Vegan')
+        self.client.get(AUTOCOMPLETE_URL,{'q':'ve'})
+
+        Tag.objects.create(user=self.user,name='Vegetarian')
+        res = self.client.get(AUTOCOMPLETE_URL,{'q':'ve'})
+
+        self.assertEqual(len(res.data),2)
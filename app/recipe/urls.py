@@ -18,6 +18,7 @@ router.register('ingredients',views.IngrediantViewSet)
 app_name='recipe'
 
 urlpatterns =[
+    path('stats/',views.RecipeStatsView.as_view(),name='stats'),
     path('',include(router.urls))
 ]
 
@@ -1,21 +1,162 @@
 """
 View for recipe APIs.
 """
+import hashlib
+
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
     OpenApiParameter,
     OpenApiTypes,
 )
-from rest_framework import (viewsets,mixins,status)
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+)
+from django.db.models.functions import Coalesce
+from rest_framework import (viewsets,mixins,status,generics)
+from rest_framework.exceptions import (APIException,ValidationError)
+from rest_framework.fields import (
+    BooleanField,
+    DecimalField,
+    IntegerField,
+)
+from rest_framework.pagination import (
+    CursorPagination,
+    LimitOffsetPagination,
+)
 
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import (Recipe,Tag, Ingredient)
+from core import metrics
+from core.authentication import MeteredTokenAuthentication
+from core.models import (Recipe,Tag, Ingredient, RecipeSimilarity)
+from core.sharding import (shard_for_user,use_shard)
+from core.user_cache import user_cache_version
 from recipe import serializers
+from recipe import stats
+from recipe.similarity import SIMILAR_RECIPES
+
+
+class ShardMoving(APIException):
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail='Recipe data is being moved, try again shortly.'
+    default_code='shard_moving'
+
+
+class UserShardMixin:
+    """Run the request against the shard holding the user's recipe data"""
+
+    def initial(self,request,*args,**kwargs):
+        super().initial(request,*args,**kwargs)
+        write=request.method not in ('GET','HEAD','OPTIONS')
+        alias,moving=shard_for_user(request.user.pk,fresh=write)
+        if moving and write:
+            raise ShardMoving()
+        use_shard(alias)
+
+    def finalize_response(self,request,response,*args,**kwargs):
+        use_shard(None)
+        return super().finalize_response(request,response,*args,**kwargs)
+
+    def shard_atomic(self):
+        """Transaction on the user's shard, stats upkeep commits with it"""
+        return transaction.atomic(using=router.db_for_write(Recipe))
+
+    def perform_update(self,serializer):
+        with self.shard_atomic():
+            super().perform_update(serializer)
+
+    def perform_destroy(self,instance):
+        with self.shard_atomic():
+            super().perform_destroy(instance)
+
+COOKABLE_LIMIT=20
+COOKABLE_MAX_LIMIT=100
+AUTOCOMPLETE_LIMIT=10
+AUTOCOMPLETE_MAX_LIMIT=50
+ATTR_ORDERINGS=('name','-name','recipe_count','-recipe_count')
+# Each has a (user, field, id) index, don't add one without an index
+RECIPE_ORDERINGS=(
+    'price','-price','time_minutes','-time_minutes','title','-title',
+)
+
+
+class AttrPagination(LimitOffsetPagination):
+    """Opt-in ?limit=&offset= pages for tag and ingredient lists"""
+    max_limit=200
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Opt-in keyset pages (?page_size=) in the list's current ordering"""
+    page_size=None
+    page_size_query_param='page_size'
+    max_page_size=200
+
+    def get_ordering(self,request,queryset,view):
+        """Page in the order the view gave the queryset"""
+        return tuple(queryset.query.order_by) or ('-id',)
+
+
+def limit_param(request,default,maximum):
+    """Read ?limit= clamped to 1..maximum"""
+    try:
+        limit=int(request.query_params.get('limit',default))
+    except ValueError:
+        limit=default
+    return max(1,min(limit,maximum))
+
+
+def flag_param(request,name):
+    """Read an on/off ?name= (1/0, true/false), 400 on anything else"""
+    try:
+        return BooleanField().run_validation(
+            request.query_params.get(name,False),
+        )
+    except ValidationError as exc:
+        raise ValidationError({name:exc.detail})
+
+
+def ids_param(request,name):
+    """Read a comma separated ?name= list of ids, 400 on anything else"""
+    field=IntegerField(min_value=1,max_value=2**63-1)
+    try:
+        return [
+            field.run_validation(value)
+            for value in request.query_params.get(name,'').split(',')
+        ]
+    except ValidationError as exc:
+        raise ValidationError({name:exc.detail})
+
+
+SPARSE_FIELDS_PARAMETERS=[
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma seperated list of fields to return'
+    ),
+    OpenApiParameter(
+        'exclude',
+        OpenApiTypes.STR,
+        description='Comma seperated list of fields to leave out'
+    ),
+]
 
 @extend_schema_view(
     list=extend_schema(
@@ -30,22 +171,178 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description='comma seperated list of ingredients ids to filter'
-            )
-            
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='Full text search over title and description'
+            ),
+            OpenApiParameter(
+                'facets',
+                OpenApiTypes.BOOL,
+                description='Wrap results with tag/ingredient counts'
+            ),
+            OpenApiParameter(
+                'max_time_minutes',
+                OpenApiTypes.INT,
+                description='Only recipes taking at most this long'
+            ),
+            OpenApiParameter(
+                'min_price',
+                OpenApiTypes.DECIMAL,
+                description='Only recipes costing at least this much'
+            ),
+            OpenApiParameter(
+                'max_price',
+                OpenApiTypes.DECIMAL,
+                description='Only recipes costing at most this much'
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR,
+                enum=list(RECIPE_ORDERINGS),
+                description='Sort field, newest first when not given'
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
         ]
-    )
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
 )
-
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(UserShardMixin, viewsets.ModelViewSet):
     """Viewset for managing recipe APIs"""
     serializer_class=serializers.RecipeDetailSerializer
     queryset=Recipe.objects.all()
-    authentication_classes=[TokenAuthentication]
+    authentication_classes=[MeteredTokenAuthentication]
     permission_classes=[IsAuthenticated]
+    pagination_class=RecipeCursorPagination
+
+    RELATED_FIELDS=('tag','ingredients')
+    FACETS=(
+        ('tag',Recipe.tag.through,'tag'),
+        ('ingredients',Recipe.ingredients.through,'ingredient'),
+    )
+    FILTER_PARAMS=(
+        'tag','ingredients','search',
+        'max_time_minutes','min_price','max_price',
+    )
+    RANGE_FILTERS=(
+        ('max_time_minutes','time_minutes__lte',IntegerField()),
+        # rejects NaN and Infinity, which Decimal() parses
+        (
+            'min_price','price__gte',
+            DecimalField(max_digits=None,decimal_places=None),
+        ),
+        (
+            'max_price','price__lte',
+            DecimalField(max_digits=None,decimal_places=None),
+        ),
+    )
+    SEARCH_FIELDS=('rank','title_headline','headline')
+    HEADLINE_FIELDS=('title_headline','headline')
+    SEARCH_CONFIG='english'
 
     def _params_to_int(self,qs):
         """Convert a list of strings to Integer """
         return [int(str_id) for str_id in qs.split(',')]
+
+    def _ordering(self):
+        """Return the whitelisted ?ordering= with an id tiebreak, if any"""
+        ordering=self.request.query_params.get('ordering')
+        if not ordering:
+            return None
+        if ordering not in RECIPE_ORDERINGS:
+            raise ValidationError({
+                'ordering':f'Choose one of {", ".join(RECIPE_ORDERINGS)}'
+            })
+        return (ordering,'-id' if ordering.startswith('-') else 'id')
+
+    def _range_filters(self,queryset):
+        """Apply ?max_time_minutes=, ?min_price= and ?max_price="""
+        for param,lookup,field in self.RANGE_FILTERS:
+            value=self.request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                value=field.run_validation(value)
+            except ValidationError as exc:
+                raise ValidationError({param:exc.detail})
+            queryset=queryset.filter(**{lookup:value})
+        return queryset
+
+    def _select_fields(self,queryset,ordering=None):
+        """Load only the columns and relations the response will use"""
+        fields=serializers.requested_fields(
+            self.request.query_params,
+            self.get_serializer_class().Meta.fields,
+        )
+        # keyset pagination reads the sort key of the last row
+        fields+=[
+            name.lstrip('-') for name in ordering or ()
+            if name.lstrip('-') not in fields
+        ]
+        columns=[
+            name for name in fields
+            if name not in self.RELATED_FIELDS+self.SEARCH_FIELDS
+        ]
+        related=[name for name in fields if name in self.RELATED_FIELDS]
+        return queryset.only(*columns).prefetch_related(*related)
+
+    def _search_query(self,term):
+        return SearchQuery(
+            term,
+            search_type='websearch',
+            config=self.SEARCH_CONFIG,
+        )
+
+    def _search(self,queryset,term):
+        """Filter by ?search=, ranked by relevance on postgres"""
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(title__icontains=term) | Q(description__icontains=term)
+            ).order_by('-id')
+        query=self._search_query(term)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'),query),
+        ).order_by('-rank','-id')
+
+    def _headlines(self,recipes,term):
+        """{recipe id: (title, description)} with the ?search= terms marked
+
+        ts_headline reparses the whole text, so it runs only for the
+        recipes being returned rather than for every match being ranked.
+        """
+        query=self._search_query(term)
+        rows=self.queryset.filter(
+            id__in=[recipe.id for recipe in recipes],
+        ).annotate(
+            title_headline=SearchHeadline(
+                'title',query,config=self.SEARCH_CONFIG,
+                highlight_all=True,
+            ),
+            headline=SearchHeadline(
+                'description',query,config=self.SEARCH_CONFIG,
+            ),
+        ).values_list('id','title_headline','headline')
+        return {recipe_id:headlines for recipe_id,*headlines in rows}
+
+    def get_serializer(self,*args,**kwargs):
+        """Add the headlines of the recipes on a ?search= page"""
+        if args and self.action == 'list':
+            params=self.request.query_params
+            search=params.get('search')
+            wanted=set(self.HEADLINE_FIELDS).intersection(
+                serializers.requested_fields(params,self.HEADLINE_FIELDS),
+            )
+            if (search and wanted
+                    and connections[self.queryset.db].vendor
+                    == 'postgresql'):
+                recipes=list(args[0])
+                kwargs['context']={
+                    **self.get_serializer_context(),
+                    'headlines':self._headlines(recipes,search),
+                }
+                args=(recipes,)+args[1:]
+        return super().get_serializer(*args,**kwargs)
     
     
     def get_queryset(self):
@@ -60,79 +357,352 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if ingredients:
             ingredient_ids=self._params_to_int(ingredients)
             queryset= queryset.filter(ingredients__id__in=ingredient_ids)
-        return queryset.filter(
+        queryset=self._range_filters(queryset)
+        ordering=self._ordering() if self.action == 'list' else None
+        if self.action in ('list','retrieve'):
+            queryset=self._select_fields(queryset,ordering)
+        queryset=queryset.filter(
             user=self.request.user,
-        ).order_by('-id').distinct()
+        ).order_by('-id')
+        search=self.request.query_params.get('search')
+        if search and self.action == 'list':
+            queryset=self._search(queryset,search)
+        if ordering:
+            queryset=queryset.order_by(*ordering)
+        return queryset.distinct()
+
+    def _facets(self,queryset):
+        """Count recipes of the filtered set per tag and per ingredient"""
+        params=self.request.query_params
+        key='recipe-facets:{}:{}:{}'.format(
+            self.request.user.pk,
+            user_cache_version(self.request.user.pk),
+            hashlib.sha1(
+                repr([params.get(name) for name in self.FILTER_PARAMS])
+                .encode()
+            ).hexdigest(),
+        )
+        facets=cache.get(key)
+        metrics.record_cache('recipe_facets',facets is not None)
+        if facets is not None:
+            return facets
 
+        recipe_ids=queryset.order_by().values('id')
+        facets={}
+        for name,through,field in self.FACETS:
+            counts=through.objects.filter(
+                recipe_id__in=recipe_ids,
+            ).values(f'{field}_id',f'{field}__name').annotate(
+                count=Count('recipe_id'),
+            ).order_by('-count',f'{field}__name')
+            facets[name]=[
+                {
+                    'id':row[f'{field}_id'],
+                    'name':row[f'{field}__name'],
+                    'count':row['count'],
+                }
+                for row in counts
+            ]
+        cache.set(key,facets,settings.FACET_CACHE_SECONDS)
+        return facets
 
+    def list(self,request,*args,**kwargs):
+        """List recipes, with ?facets=1 wrapped as {results, facets}"""
+        response=super().list(request,*args,**kwargs)
+        if not flag_param(request,'facets'):
+            return response
+        facets=self._facets(self.filter_queryset(self.get_queryset()))
+        if isinstance(response.data,dict):
+            response.data['facets']=facets
+        else:
+            response.data={'results':response.data,'facets':facets}
+        return response
 
     def get_serializer_class(self):
         if self.action == 'list':
+            if self.request.query_params.get('search'):
+                return serializers.RecipeSearchSerializer
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'cookable':
+            return serializers.CookableRecipeSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
         return self.serializer_class
        
          
 
     def perform_create(self, serializer):
         """Create new recipe"""
-        serializer.save(user=self.request.user)
+        with self.shard_atomic():
+            serializer.save(user=self.request.user)
     
     @action(methods=['POST'],detail=True,url_path='upload_image')
     def upload_image(self,request,pk=None):
         """Upload an image to recipe."""
         recipe=self.get_object()
         serializer=self.get_serializer(recipe,data=request.data)
+        image=request.FILES.get('image')
+        if image is not None:
+            metrics.IMAGE_UPLOAD_BYTES.observe(image.size)
 
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data,status=status.HTTP_200_OK)
         
         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
-        
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description=f'Number of recipes, at most {SIMILAR_RECIPES}'
+            ),
+        ]
+    )
+    @action(methods=['GET'],detail=True)
+    def similar(self,request,pk=None):
+        """Most similar recipes by shared tags and ingredients"""
+        recipe=self.get_object()
+        limit=limit_param(request,SIMILAR_RECIPES,SIMILAR_RECIPES)
+        neighbours=RecipeSimilarity.objects.filter(
+            recipe=recipe,
+        ).select_related('similar').order_by('-score','-similar_id')[:limit]
+        recipes=[]
+        for row in neighbours:
+            row.similar.score=row.score
+            recipes.append(row.similar)
+        serializer=self.get_serializer(recipes,many=True)
+        return Response(serializer.data)
+
+    def _cookable(self,ingredient_ids):
+        """Rank the user's recipes by coverage of ingredient_ids"""
+        # Ranking is one grouped query over the recipe/ingredient table,
+        # only the returned page loads its missing ingredients
+        return self.queryset.filter(user=self.request.user).annotate(
+            total=Count('ingredients',distinct=True),
+            covered=Count(
+                'ingredients',
+                filter=Q(ingredients__id__in=ingredient_ids),
+                distinct=True,
+            ),
+        ).filter(covered__gt=0).annotate(
+            missing_count=F('total')-F('covered'),
+        ).order_by('missing_count','-covered','-id').prefetch_related(
+            Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.exclude(
+                    id__in=ingredient_ids,
+                ).order_by('name'),
+                to_attr='missing_ingredients',
+            ),
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'have',
+                OpenApiTypes.STR,
+                description='Comma seperated list of ingredient ids on hand'
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description=f'Number of recipes, at most {COOKABLE_MAX_LIMIT}'
+            ),
+        ]
+    )
+    @action(methods=['GET'],detail=False)
+    def cookable(self,request):
+        """Recipes ranked by fewest missing ingredients, then most covered"""
+        have=request.query_params.get('have')
+        if not have:
+            return Response([])
+        ingredient_ids=ids_param(request,'have')
+        limit=limit_param(request,COOKABLE_LIMIT,COOKABLE_MAX_LIMIT)
+
+        recipes=self._cookable(ingredient_ids)[:limit]
+        serializer=self.get_serializer(recipes,many=True)
+        return Response(serializer.data)
+
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
             OpenApiParameter(
                 'assigned_only',
-                OpenApiTypes.INT,enum=[0,1],
+                OpenApiTypes.BOOL,
                 description='Filter by item assigned to recipe'
-            )
+            ),
+            OpenApiParameter(
+                'recipe_count',
+                OpenApiTypes.BOOL,
+                description='Include the number of recipes using each item'
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR,
+                enum=list(ATTR_ORDERINGS),
+                description='Sort by name or by popularity (recipe_count)'
+            ),
         ]
     )
 )
-class BaseRcipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRcipeAttrViewSet(UserShardMixin,
+                           mixins.DestroyModelMixin,
                            mixins.UpdateModelMixin,
                            mixins.ListModelMixin,
                            viewsets.GenericViewSet):
     """Base viewset for recipes"""
-    authentication_classes=[TokenAuthentication]
+    authentication_classes=[MeteredTokenAuthentication]
     permission_classes=[IsAuthenticated]
+    pagination_class=AttrPagination
+
+    # M2M table linking recipes to this model and its column for the model
+    recipe_through=None
+    through_field=None
+    count_serializer_class=None
+
+    def _usage(self):
+        """Recipe links of the outer row, for EXISTS / COUNT subqueries"""
+        return self.recipe_through.objects.filter(
+            **{f'{self.through_field}_id':OuterRef('pk')}
+        )
+
+    def _ordering(self):
+        """Return the whitelisted ?ordering=, by name if not given"""
+        ordering=self.request.query_params.get('ordering','-name')
+        if ordering not in ATTR_ORDERINGS:
+            raise ValidationError({
+                'ordering':f'Choose one of {", ".join(ATTR_ORDERINGS)}'
+            })
+        return ordering
+
+    def _with_counts(self):
+        return (
+            flag_param(self.request,'recipe_count')
+            or 'recipe_count' in self._ordering()
+        )
 
     def get_queryset(self):
         """Filter queryset to authenticate user"""
-        assigned_only =  bool(
-            int(self.request.query_params.get('assigned_only',0))
-        )
-        queryset=self.queryset
+        assigned_only=flag_param(self.request,'assigned_only')
+        queryset=self.queryset.filter(user=self.request.user)
+        if self.action != 'list':
+            return queryset.order_by('-name')
         if assigned_only:
-            queryset=queryset.filter(recipe__isnull=False)
+            queryset=queryset.filter(Exists(self._usage()))
+        if self._with_counts():
+            counts=self._usage().order_by().values(
+                f'{self.through_field}_id',
+            ).annotate(count=Count('*')).values('count')
+            queryset=queryset.annotate(
+                recipe_count=Coalesce(Subquery(counts),0),
+            )
+        ordering=self._ordering()
+        tiebreak='name' if 'recipe_count' in ordering else '-id'
+        return queryset.order_by(ordering,tiebreak)
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self._with_counts():
+            return self.count_serializer_class
+        return self.serializer_class
+
+    def _prefix_matches(self,queryset,prefix):
+        """Names starting with prefix, via the (user, UPPER(name)) index"""
+        return queryset.filter(name__istartswith=prefix).order_by('name')
+
+    def _similar_matches(self,queryset,prefix):
+        """Close trigram matches, served by the (user, name) trigram index"""
+        return queryset.filter(name__trigram_similar=prefix).annotate(
+            similarity=TrigramSimilarity('name',prefix),
+        ).order_by('-similarity','name')
+
+    def _autocomplete(self,prefix,limit):
+        """Names starting with prefix first, then close trigram matches
 
-        return queryset.filter(
-            user=self.request.user
-            ).order_by('-name').distinct()
+        The two are separate queries so each one can use its own index, an
+        OR of both would leave the planner a bitmap OR or a scan.
+        """
+        queryset=self.queryset.filter(user=self.request.user)
+        matches=list(self._prefix_matches(queryset,prefix)[:limit])
+        if (len(matches)<limit
+                and connections[queryset.db].vendor=='postgresql'):
+            matches+=self._similar_matches(queryset,prefix).exclude(
+                id__in=[match.id for match in matches],
+            )[:limit-len(matches)]
+        return matches
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description='Typed prefix, small typos are tolerated'
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description=(
+                    f'Number of matches, at most {AUTOCOMPLETE_MAX_LIMIT}'
+                ),
+            ),
+        ]
+    )
+    @action(methods=['GET'],detail=False)
+    def autocomplete(self,request):
+        """Top matching names for an autocomplete box"""
+        prefix=request.query_params.get('q','').strip().lower()
+        limit=limit_param(request,AUTOCOMPLETE_LIMIT,AUTOCOMPLETE_MAX_LIMIT)
+        if not prefix:
+            return Response([])
+
+        key='autocomplete:{}:{}:{}:{}:{}'.format(
+            self.queryset.model._meta.model_name,
+            request.user.pk,
+            user_cache_version(request.user.pk),
+            limit,
+            hashlib.sha1(prefix.encode()).hexdigest(),
+        )
+        data=None
+        if settings.AUTOCOMPLETE_CACHE_SECONDS:
+            data=cache.get(key)
+            metrics.record_cache('autocomplete',data is not None)
+        if data is None:
+            serializer=self.get_serializer(
+                self._autocomplete(prefix,limit),
+                many=True,
+            )
+            data=serializer.data
+            if settings.AUTOCOMPLETE_CACHE_SECONDS:
+                cache.set(key,data,settings.AUTOCOMPLETE_CACHE_SECONDS)
+        return Response(data)
 
 class TagViewSet(BaseRcipeAttrViewSet):
     """Manage Tags in Database"""
     serializer_class=serializers.TagSerializer
+    count_serializer_class=serializers.TagCountSerializer
     queryset=Tag.objects.all()
+    recipe_through=Recipe.tag.through
+    through_field='tag'
          
 
 class IngrediantViewSet(BaseRcipeAttrViewSet):
     """manage ingredient in Database"""
     serializer_class=serializers.IngredientSerializer
+    count_serializer_class=serializers.IngredientCountSerializer
     queryset=Ingredient.objects.all()
-    
+    recipe_through=Recipe.ingredients.through
+    through_field='ingredient'
+
+
+class RecipeStatsView(UserShardMixin, generics.RetrieveAPIView):
+    """Dashboard stats of the authenticated user's recipes"""
+    serializer_class=serializers.UserRecipeStatsSerializer
+    authentication_classes=[MeteredTokenAuthentication]
+    permission_classes=[IsAuthenticated]
 
-    
\ No newline at end of file
+    def get_object(self):
+        return stats.for_user(self.request.user.pk)
@@ -8,7 +8,9 @@ from django.contrib.auth import (
 from django.utils.translation import gettext as _
 from rest_framework import serializers
 
-class UserSerializer(serializers.ModelSerializer):
+from core.middleware import TimedSerializerMixin
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializers for the users"""
 
     class Meta:
@@ -31,7 +33,7 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
         return user
 
-class AuthTokenSerializer(serializers.Serializer):
+class AuthTokenSerializer(TimedSerializerMixin, serializers.Serializer):
     """Serializer for user auth token"""
     email = serializers.EmailField()
     password = serializers.CharField(
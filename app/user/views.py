@@ -1,9 +1,10 @@
 """"
 Views for user API
 """
-from rest_framework import generics,authentication,permissions
+from rest_framework import generics,permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from core.authentication import MeteredTokenAuthentication
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -25,7 +26,7 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the Authenticated Use"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [MeteredTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 
@@ -1,3 +1,7 @@
+upstream app_server {
+    server ${APP_HOST}:${APP_PORT};
+}
+
 server{
     listen ${LISTEN_PORT};
 
@@ -5,9 +9,29 @@ server{
         alias /vol/static;
     }
 
+    location = /healthz {
+        access_log            off;
+        include               /etc/nginx/app_pass.conf;
+        ${APP_PASS}_read_timeout    2s;
+    }
+
+    location = /readyz {
+        access_log            off;
+        include               /etc/nginx/app_pass.conf;
+        ${APP_PASS}_read_timeout    5s;
+    }
+
+    # Prometheus scrapes from loopback or the configured scrape network
+    location = /metrics {
+        allow                 127.0.0.1;
+        allow                 ${METRICS_ALLOW};
+        deny                  all;
+        access_log            off;
+        include               /etc/nginx/app_pass.conf;
+    }
+
     location /{
-        uwsgi_pass            ${APP_HOST}:${APP_PORT};
-        include               /etc/nginx/uwsgi_params;
+        include               /etc/nginx/app_pass.conf;
         client_max_body_size  10M;
     }
-}
\ No newline at end of file
+}
@@ -2,5 +2,25 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
-nginx -g 'daemon off;'
\ No newline at end of file
+# APP_PROTOCOL=uwsgi talks to uWSGI, APP_PROTOCOL=http to the ASGI server
+if [ "${APP_PROTOCOL:-uwsgi}" = "http" ]; then
+    export APP_PASS=proxy
+    cat > /etc/nginx/app_pass.conf <<'CONF'
+proxy_pass            http://app_server;
+proxy_http_version    1.1;
+proxy_set_header      Host $host;
+proxy_set_header      X-Forwarded-For $proxy_add_x_forwarded_for;
+proxy_set_header      X-Forwarded-Proto $scheme;
+proxy_request_buffering off;
+CONF
+else
+    export APP_PASS=uwsgi
+    cat > /etc/nginx/app_pass.conf <<'CONF'
+uwsgi_pass            app_server;
+include               /etc/nginx/uwsgi_params;
+CONF
+fi
+
+envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT} ${APP_PASS} ${METRICS_ALLOW}' \
+    < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+nginx -g 'daemon off;'
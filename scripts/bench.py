@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Small HTTP load generator for comparing serving/database setups.
+
+Usage:
+    python scripts/bench.py http://localhost:8000/api/recipe/recipes/ \
+        --token <auth token> --requests 500 --concurrency 8
+
+--slow-clients N keeps N extra clients trickling upload bodies to
+--slow-url while the benchmark runs, to see how slow clients affect
+everyone else.
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def timed_request(url, headers):
+    """Return (status, seconds) for a single GET request"""
+    req = urllib.request.Request(url, headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as res:
+            res.read()
+            code = res.status
+    except urllib.error.HTTPError as exc:
+        code = exc.code
+    return code, time.perf_counter() - start
+
+
+def trickle_upload(url, headers, seconds, stop):
+    """POST a multipart body a few bytes at a time until stop is set"""
+    parts = urllib.parse.urlsplit(url)
+    chunks = int(seconds * 10)
+    body = b'x' * chunks
+    while not stop.is_set():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+        conn.putrequest('POST', parts.path)
+        for name, value in headers.items():
+            conn.putheader(name, value)
+        conn.putheader('Content-Type', 'multipart/form-data; boundary=x')
+        conn.putheader('Content-Length', str(len(body)))
+        conn.endheaders()
+        for index in range(chunks):
+            if stop.is_set():
+                break
+            conn.send(body[index:index + 1])
+            time.sleep(0.1)
+        else:
+            conn.getresponse().read()
+        conn.close()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values"""
+    index = max(0, int(round(pct / 100 * len(values))) - 1)
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('url')
+    parser.add_argument('--token', default='')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--slow-clients', type=int, default=0)
+    parser.add_argument('--slow-url')
+    parser.add_argument('--slow-seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    headers = {}
+    if args.token:
+        headers['Authorization'] = f'Token {args.token}'
+
+    stop = threading.Event()
+    for _ in range(args.slow_clients):
+        threading.Thread(
+            target=trickle_upload,
+            args=(args.slow_url or args.url, headers, args.slow_seconds, stop),
+            daemon=True,
+        ).start()
+    if args.slow_clients:
+        time.sleep(1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(
+            lambda _: timed_request(args.url, headers),
+            range(args.requests),
+        ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    latencies = sorted(seconds * 1000 for _, seconds in results)
+    errors = sum(1 for code, _ in results if code >= 400)
+    print(f'requests     {len(results)} ({errors} errors)')
+    print(f'throughput   {len(results) / elapsed:.1f} req/s')
+    print(f'mean         {statistics.mean(latencies):.2f} ms')
+    for pct in (50, 90, 99):
+        print(f'p{pct:<11} {percentile(latencies, pct):.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+#!/bin/sh
+# Compare uWSGI serving profiles on the deploy stack.
+#
+#   TOKEN=<auth token> scripts/bench_profiles.sh [url]
+#
+# Restarts the app container with each UWSGI_PROFILE and runs bench.py
+# against it, printing the results one after another.
+
+set -e
+
+URL=${1:-http://localhost:8000/api/recipe/recipes/}
+COMPOSE="docker-compose -f docker-compose-deploy.yml"
+
+for profile in balanced throughput memory; do
+    echo "== ${profile}"
+    UWSGI_PROFILE=$profile $COMPOSE up -d --force-recreate app
+    until curl -sf "${URL%/api/*}/readyz" > /dev/null; do sleep 1; done
+    python scripts/bench.py "$URL" --token "$TOKEN" \
+        --requests "${REQUESTS:-1000}" --concurrency "${CONCURRENCY:-16}"
+    $COMPOSE exec -T app sh -c \
+        'ps -o rss,args | grep "[u]wsgi" | awk "{s+=\$1} END {print \"rss \" s \" KB\"}"'
+done
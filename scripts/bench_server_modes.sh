@@ -0,0 +1,22 @@
+#!/bin/sh
+# Compare WSGI (uWSGI) and ASGI (gunicorn + uvicorn) serving under slow
+# uploading clients on the deploy stack.
+#
+#   TOKEN=<auth token> RECIPE_ID=<id> scripts/bench_server_modes.sh [host]
+
+set -e
+
+HOST=${1:-http://localhost:8000}
+COMPOSE="docker-compose -f docker-compose-deploy.yml"
+
+for mode in wsgi asgi; do
+    if [ "$mode" = "asgi" ]; then protocol=http; else protocol=uwsgi; fi
+    echo "== ${mode}"
+    SERVER_MODE=$mode APP_PROTOCOL=$protocol \
+        $COMPOSE up -d --force-recreate app proxy
+    until curl -sf "${HOST}/readyz" > /dev/null; do sleep 1; done
+    python scripts/bench.py "${HOST}/api/recipe/recipes/" --token "$TOKEN" \
+        --requests "${REQUESTS:-500}" --concurrency "${CONCURRENCY:-8}" \
+        --slow-clients "${SLOW_CLIENTS:-16}" \
+        --slow-url "${HOST}/api/recipe/recipes/${RECIPE_ID}/upload_image/"
+done
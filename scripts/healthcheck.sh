@@ -0,0 +1,10 @@
+#!/bin/sh
+
+# Container healthcheck: ask the running server if it is ready to serve.
+# uWSGI answers plain HTTP on a loopback-only port, gunicorn (asgi) on :9000
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    port=9000
+else
+    port=9001
+fi
+exec wget -q -O /dev/null -T 5 "http://127.0.0.1:${port}/readyz"
@@ -2,8 +2,81 @@
 
 set -e
 
+# Number of CPUs this container may use, from the cgroup quota when set
+cpu_limit() {
+    quota=""
+    period=""
+    if [ -f /sys/fs/cgroup/cpu.max ]; then
+        read -r quota period < /sys/fs/cgroup/cpu.max
+    elif [ -f /sys/fs/cgroup/cpu/cpu.cfs_quota_us ]; then
+        quota=$(cat /sys/fs/cgroup/cpu/cpu.cfs_quota_us)
+        period=$(cat /sys/fs/cgroup/cpu/cpu.cfs_period_us)
+    fi
+    if [ -n "$quota" ] && [ "$quota" != "max" ] && [ "$quota" -gt 0 ]; then
+        echo $(( (quota + period - 1) / period ))
+    else
+        nproc
+    fi
+}
+
+CPUS=$(cpu_limit)
+
+# UWSGI_PROFILE picks defaults, any UWSGI_* variable set explicitly wins:
+#   balanced   - 2 workers per CPU, 2 threads, scale down when idle
+#   throughput - 2 workers per CPU + 1, 4 threads, all workers always up
+#   memory     - 1 worker per CPU, 4 threads, aggressive recycling
+case "${UWSGI_PROFILE:-balanced}" in
+    throughput)
+        : "${UWSGI_WORKERS:=$((CPUS * 2 + 1))}"
+        : "${UWSGI_THREADS:=4}"
+        : "${UWSGI_CHEAPER:=0}"
+        ;;
+    memory)
+        : "${UWSGI_WORKERS:=$CPUS}"
+        : "${UWSGI_THREADS:=4}"
+        : "${UWSGI_CHEAPER:=1}"
+        : "${UWSGI_MAX_REQUESTS:=1000}"
+        : "${UWSGI_RELOAD_ON_RSS:=192}"
+        ;;
+    *)
+        : "${UWSGI_WORKERS:=$((CPUS * 2))}"
+        : "${UWSGI_THREADS:=2}"
+        : "${UWSGI_CHEAPER:=$CPUS}"
+        ;;
+esac
+: "${UWSGI_MAX_REQUESTS:=5000}"
+: "${UWSGI_RELOAD_ON_RSS:=384}"
+: "${UWSGI_HARAKIRI:=60}"
+if [ "$UWSGI_CHEAPER" -ge "$UWSGI_WORKERS" ]; then
+    UWSGI_CHEAPER=0
+fi
+export UWSGI_WORKERS UWSGI_THREADS UWSGI_CHEAPER UWSGI_MAX_REQUESTS \
+    UWSGI_RELOAD_ON_RSS UWSGI_HARAKIRI
+
+# Workers write metrics here so /metrics can aggregate across them
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/vol/metrics}
+rm -rf "${PROMETHEUS_MULTIPROC_DIR:?}"/*
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 python manage.py wait_for_db
-python manage.py collectstatic --noinput
-python manage.py migrate
+python manage.py startup
+
+# SERVER_MODE=asgi serves app.asgi with uvicorn workers under gunicorn
+# (speaks HTTP, so run the proxy with APP_PROTOCOL=http). Each worker reads
+# request bodies asynchronously, so slow uploads don't tie up a worker; sync
+# views run in a thread pool.
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    : "${ASGI_WORKERS:=$CPUS}"
+    echo "gunicorn/uvicorn: ${CPUS} cpus, ${ASGI_WORKERS} workers"
+    exec gunicorn app.asgi:application \
+        --worker-class uvicorn.workers.UvicornWorker \
+        --workers "$ASGI_WORKERS" \
+        --bind :9000 \
+        --preload \
+        --max-requests "$UWSGI_MAX_REQUESTS" \
+        --max-requests-jitter 100 \
+        --timeout "$UWSGI_HARAKIRI"
+fi
 
-uwsgi --socket : 9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+echo "uwsgi: ${CPUS} cpus, ${UWSGI_WORKERS} workers x ${UWSGI_THREADS} threads"
+exec uwsgi --ini /scripts/uwsgi.ini
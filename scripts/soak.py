@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Soak test: hammer the recipe endpoints and follow per-worker memory.
+
+Usage:
+    python scripts/soak.py http://localhost:8000 --token <user token> \
+        --staff-token <staff token> --minutes 30
+
+Run the app with MEMORY_PROFILE_EVERY set to also collect tracemalloc
+reports; the top growing allocation sites of every worker are printed at
+the end.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def call(url, token, method='GET', body=None):
+    """Make a JSON API request and return the decoded response"""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={
+        'Authorization': f'Token {token}',
+        'Content-Type': 'application/json',
+    })
+    with urllib.request.urlopen(req) as res:
+        content = res.read()
+    return json.loads(content) if content else None
+
+
+def hammer(host, token, stop, errors, lock):
+    """Create, list, read and delete recipes until stop is set
+
+    Failed requests are counted in errors by kind and the loop goes on, so
+    the load keeps running and the report shows how much of it failed.
+    """
+    recipes = f'{host}/api/recipe/recipes/'
+    while not stop.is_set():
+        try:
+            recipe = call(recipes, token, 'POST', {
+                'title': 'Soak recipe',
+                'time_minutes': 10,
+                'price': '4.50',
+                'tag': [{'name': 'soak'}],
+                'ingredients': [{'name': 'water'}],
+            })
+            call(recipes, token)
+            call(f'{recipes}{recipe["id"]}/', token)
+            call(f'{host}/api/recipe/tags/?assigned_only=1', token)
+            call(f'{recipes}{recipe["id"]}/', token, 'DELETE')
+        except urllib.error.HTTPError as exc:
+            with lock:
+                errors[f'HTTP {exc.code}'] += 1
+        except (OSError, ValueError) as exc:
+            with lock:
+                errors[type(exc).__name__] += 1
+            # the server may be down, don't spin on refused connections
+            stop.wait(1)
+
+
+def sample_workers(host, staff_token, polls):
+    """Poll the memory endpoint to reach as many workers as possible"""
+    reports = {}
+    for _ in range(polls):
+        report = call(f'{host}/api/memory/', staff_token)
+        reports[report['pid']] = report
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('host')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--staff-token', required=True)
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--interval', type=float, default=30)
+    parser.add_argument('--polls', type=int, default=20)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    errors = Counter()
+    lock = threading.Lock()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    futures = [
+        pool.submit(hammer, args.host, args.token, stop, errors, lock)
+        for _ in range(args.concurrency)
+    ]
+
+    history = {}
+    start = time.monotonic()
+    end = start + args.minutes * 60
+    reports = {}
+    while time.monotonic() < end:
+        time.sleep(args.interval)
+        reports = sample_workers(args.host, args.staff_token, args.polls)
+        elapsed = time.monotonic() - start
+        alive = sum(not future.done() for future in futures)
+        with lock:
+            failed = dict(errors)
+        print(
+            f'{elapsed:7.0f}s {alive}/{len(futures)} hammer threads, '
+            f'errors {failed or "none"}'
+        )
+        for pid, report in sorted(reports.items()):
+            history.setdefault(pid, []).append(report['rss'])
+            print(
+                f'{elapsed:7.0f}s pid {pid:>6} '
+                f'rss {report["rss"] / 2**20:8.1f} MiB '
+                f'requests {report["requests"]}'
+            )
+    stop.set()
+    pool.shutdown()
+    # raise anything a hammer thread died of
+    for future in futures:
+        future.result()
+
+    print('\nper-worker RSS growth')
+    for pid, values in sorted(history.items()):
+        growth = (values[-1] - values[0]) / 2**20
+        print(f'pid {pid:>6} {growth:+8.1f} MiB over {len(values)} samples')
+    for pid, report in sorted(reports.items()):
+        for stat in report.get('since_start', [])[:5]:
+            print(
+                f'pid {pid:>6} {stat["size_diff"] / 1024:+10.1f} KiB '
+                f'{stat["traceback"][-1] if stat["traceback"] else "?"}'
+            )
+
+
+if __name__ == '__main__':
+    main()